@@ -9,6 +9,7 @@ from mipf.core.utils import *
 from mipf.ui.data import *
 from mipf.ui.engine import *
 from mipf.ui.app import AppBase
+from trame.app import asynchronous
 import threading
 import asyncio
 import os
@@ -79,6 +80,10 @@ class Workbench(AppBase):
             # 在这里更新4D CTA的显示状态
             print(f"update_playback_progress: {playback_progress}")
             self.state.current_vessel = int(playback_progress*self.state.vessel_number)
+            # The time series only swap the frame they render
+            for node in self.data_storage.get_nodes(DataType.TimeSeries):
+                node["time_step"] = round(
+                    playback_progress*(node.data.get_number_of_time_steps()-1))
             for node in self.data_storage.nodes.values():
                 if "vessel_" in node['name']:
                     index = node["name"].split("_")[1]
@@ -128,29 +133,13 @@ class Workbench(AppBase):
         def load_files(vtk_files, **kwargs):
             if vtk_files is None or len(vtk_files) == 0:
                 return
-                
-            # 显示进度条
-            self.state.loading = True
-            self.state.loading_progress = 0
-            self.state.loading_text = "正在加载文件..."
-            
-            # 计算总文件数
-            total_files = len(vtk_files)
-            
-            # 加载所有文件
-            nodes = load_client_files(files=vtk_files, data_storage=self.data_storage)
-            
-            for node in nodes:
-                node["helper object"] = True
-                
-            self.data_storage.modefied(0)
-            
-            # 更新进度
-            self.state.loading_progress = 100
-            self.state.loading_text = "文件加载完成"
-            
-            self.init_scene()
-            self.ctrl.reset_camera()
+            asynchronous.create_task(self.load_files_async(vtk_files))
+
+        @state.change("series_files")
+        def load_series_files(series_files, **kwargs):
+            if series_files is None or len(series_files) == 0:
+                return
+            asynchronous.create_task(self.load_series_files_async(series_files))
 
         @state.change("tf_files")
         def load_tf_files(tf_files, **kwargs):
@@ -167,7 +156,7 @@ class Workbench(AppBase):
                         file.content)
 
                     for node in self.data_storage.nodes.values():
-                        if node.data.type == DataType.Image and node.get("activate"):
+                        if node.data.type in IMAGE_DATA_TYPES and node.get("activate"):
                             node["scalar_opacity"] = scalar_opacity
                             node["gradient_opacity"] = gradient_opacity
                             node["colors"] = color
@@ -193,6 +182,19 @@ class Workbench(AppBase):
                     truncate_length=0
                 )
 
+                vuetify.VFileInput(
+                    multiple=True,
+                    v_model=("series_files", None),
+                    accept=".vti,.mha,.nii,.nii.gz",
+                    __properties=["accept"],
+                    label="4D",
+                    style="max-width: 300px;",
+                    hide_details=True,
+                    dense=True,
+                    small_chips=True,
+                    truncate_length=0
+                )
+
                 vuetify.VFileInput(
                     multiple=True,
                     show_size=True,
@@ -349,6 +351,41 @@ class Workbench(AppBase):
                                         hide_details=True,
                                     )
 
+    async def load_files_async(self, vtk_files):
+        # 显示进度条
+        with self.state:
+            self.state.loading = True
+            self.state.loading_progress = 0
+            self.state.loading_text = "正在加载文件..."
+
+        # 在后台线程并行解码所有文件, 进度实时更新
+        await load_client_files_async(
+            files=vtk_files, data_storage=self.data_storage,
+            progress_callback=loading_progress_callback(self.state),
+            **{"helper object": True})
+
+        with self.state:
+            self.state.loading = False
+            self.state.loading_progress = 100
+            self.state.loading_text = "文件加载完成"
+
+            self.init_scene()
+            self.ctrl.reset_camera()
+
+    async def load_series_files_async(self, series_files):
+        # 所有帧合并为一个4D时间序列节点
+        with self.state:
+            self.state.loading = True
+            self.state.loading_text = "正在加载4D序列..."
+
+        await load_client_time_series_async(series_files, self.data_storage)
+
+        with self.state:
+            self.state.loading = False
+            self.state.loading_text = "文件加载完成"
+            self.state.playback_progress = 0
+            self.ctrl.reset_camera()
+
     def toggle_playback(self):
         self.state.is_playing = not self.state.is_playing
         self.state.flush()
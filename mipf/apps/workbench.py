@@ -11,6 +11,8 @@ from mipf.core.settings import *
 from mipf.ui.data import *
 from mipf.ui.engine import *
 from mipf.ui.app import AppBase
+from mipf.core.data_cache import data_cache
+from mipf.core.data_manager import data_manager
 
 
 server = get_server(client_type="vue2")
@@ -62,7 +64,7 @@ class Workbench(AppBase):
                     dense=True,
                     hide_details=True,
                     style="max-width: 300px;",
-                    accept=".vtp,.vti",
+                    accept=".vtp,.vti,.nii,.gz,.mha,.nrrd,.stl,.ply",
                     __properties=["accept"],
                 )
                 vuetify.VSpacer()
@@ -172,14 +174,45 @@ def main(server=None, **kwargs):
         nargs='+',
         help="List of input file paths"
     )
+    parser.add_argument(
+        '--cache_dir',
+        type=str,
+        help="Directory caching decoded images and models for faster reopening"
+    )
+    parser.add_argument(
+        '--cache_size',
+        type=float,
+        default=16,
+        help="Maximum size of the cache directory in GB"
+    )
+    parser.add_argument(
+        '--memory_budget',
+        type=float,
+        help="Memory in GB for the data of hidden nodes before spilling it to scratch files"
+    )
+    parser.add_argument(
+        '--scratch_dir',
+        type=str,
+        help="Directory of the spilled data, a temporary directory by default"
+    )
+    parser.add_argument(
+        '--lazy',
+        action='store_true',
+        help="Read only file headers at startup and the data on first display"
+    )
     
     args, unknown_args = parser.parse_known_args()
 
+    if args.cache_dir:
+        data_cache.set_directory(args.cache_dir, int(args.cache_size * (1 << 30)))
+    if args.memory_budget:
+        data_manager.set_memory_budget(int(args.memory_budget * (1 << 30)), args.scratch_dir)
+
     if args.files:
         # 遍历文件并读取内容
         for file_path in args.files:
             if os.path.exists(file_path):
-                app.load(file_path, os.path.basename(file_path))
+                app.load(file_path, os.path.basename(file_path), lazy=args.lazy)
             else:
                 print(f"File does not exist: {file_path}")
 
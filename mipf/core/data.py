@@ -4,18 +4,31 @@ from mipf.core.utils import *
 from typing import Dict
 from enum import Enum
 import uuid
+import os
+from contextlib import contextmanager
+import threading
+import functools
+from bisect import bisect_left, insort
 from collections import defaultdict
+from concurrent.futures import as_completed
 from mipf.core.data_manager import data_manager
+from mipf.core.settings import general_settings
+from mipf.core.io_manager import io_manager
+from mipf.core.dicom import scan_dicom_directory, load_dicom_series
+from mipf.core.nifti import NiftiSliceReader
+from mipf.core.surface_cut import SurfaceCutIndex
 
 from vtkmodules.vtkCommonCore import (
     vtkPoints
 )
+from vtkmodules.vtkCommonMath import vtkMatrix3x3
 from vtkmodules.vtkCommonDataModel import (
     vtkImageData,
     vtkPolyData,
-    vtkPointSet
+    vtkPointSet,
+    vtkCellArray
 )
-from vtkmodules.numpy_interface.dataset_adapter import vtkDataArrayToVTKArray
+from vtkmodules.util.numpy_support import numpy_to_vtkIdTypeArray
 
 
 class DataType(Enum):
@@ -23,6 +36,12 @@ class DataType(Enum):
     Image = 1
     Surface = 2
     PointSet = 3
+    TimeSeries = 4
+    LabelMap = 5
+
+
+# Data types rendered by the image mappers
+IMAGE_DATA_TYPES = (DataType.Image, DataType.TimeSeries, DataType.LabelMap)
 
 
 class BaseData(ABC):
@@ -30,6 +49,7 @@ class BaseData(ABC):
         self.type: DataType = None
         self.name = ""
         self._geometry: Geometry = None
+        self._modified_callbacks = []
 
     def get_geometry(self):
         return self._geometry
@@ -42,15 +62,74 @@ class BaseData(ABC):
     def read_data(self, filename: str):
         pass
 
+    def get_memory_size(self):
+        """
+        Bytes held in memory, memory mapped files are not counted.
+        """
+        return 0
+
+    def release(self, directory: str):
+        """
+        Spill the data to a scratch file of the directory and drop it from
+        memory until the next access, return the number of bytes freed.
+        """
+        return 0
+
+    def discard_spill(self):
+        pass
+
+    def add_modified_callback(self, callback):
+        if callback not in self._modified_callbacks:
+            self._modified_callbacks.append(callback)
+
+    def remove_modified_callback(self, callback):
+        if callback in self._modified_callbacks:
+            self._modified_callbacks.remove(callback)
+
+    def modified(self):
+        """
+        Mark the vtk objects modified and notify the nodes holding the data,
+        to call once done writing to the views returned by as_array.
+        """
+        self._data_modified()
+        self._trigger_modified()
+
+    def _data_modified(self):
+        pass
+
+    def _trigger_modified(self):
+        for callback in list(self._modified_callbacks):
+            callback()
+
 
 class ImageData(BaseData):
     def __init__(self):
+        BaseData.__init__(self)
         self.type = DataType.Image
         self._geometry = Geometry()
         self._image: vtkImageData = None
-
-    def read_data(self, filename: str):
-        self._image = load_image(filename)
+        self._memory_mapped = False
+        self._pyramid = []
+        self._pyramid_lock = threading.Lock()
+        self._pyramid_thread = None
+        # (scratch file, direction matrix) of the released image
+        self._spill = None
+
+    def read_data(self, filename: str, use_mmap: bool = False, use_cache: bool = True):
+        self._image, self._memory_mapped = read_image_file(
+            filename, use_mmap, use_cache)
+        self._image_changed()
+
+    def set_image(self, image: vtkImageData, memory_mapped: bool = False):
+        """
+        Hold the image by reference, e.g. one returned by load_meta_image_mmap.
+        """
+        self._image = image
+        self._memory_mapped = memory_mapped
+        self._image_changed()
+
+    def is_memory_mapped(self):
+        return self._memory_mapped
 
     def read_byte(self, type, intput):
         if type == "vti":
@@ -59,31 +138,788 @@ class ImageData(BaseData):
             reader.SetReadFromInputString(True)
             reader.Update()
             self._image = reader.GetOutput()
+            self._image_changed()
+
+    def _image_changed(self):
+        with self._pyramid_lock:
+            self._pyramid = []
+        if self._image:
+            self._geometry.set_image(self._image)
+        if self._image and general_settings.build_image_pyramid:
+            self.build_pyramid(general_settings.image_pyramid_min_size)
+
+    def get_memory_size(self):
+        image = self._image
+        size = 0
+        if image is not None and not self._memory_mapped:
+            size = image.GetActualMemorySize() * 1024
+        return size + sum(x.GetActualMemorySize() * 1024 for x in self._pyramid[1:])
+
+    def release(self, directory: str):
+        image = self._image
+        if image is None or self._memory_mapped:
+            return 0
+        size = self.get_memory_size()
+        self.discard_spill()
+        path = os.path.join(directory, uuid.uuid4().hex + ".mha")
+        save_image(image, path, compression="none")
+        # Meta images written by vtk do not keep the direction
+        direction = vtkMatrix3x3()
+        direction.DeepCopy(image.GetDirectionMatrix())
+        self._spill = (path, direction)
+        self._image = None
+        with self._pyramid_lock:
+            self._pyramid = []
+        return size
+
+    def _restore(self):
+        path, direction = self._spill
+        image = load_meta_image_mmap(path)
+        memory_mapped = image is not None
+        if image is None:
+            image, memory_mapped = read_image_file(path, use_cache=False)
+        image.SetDirectionMatrix(direction)
+        self.set_image(image, memory_mapped)
+
+    def discard_spill(self):
+        if self._spill is not None:
+            try:
+                os.remove(self._spill[0])
+            except OSError:
+                # Still mapped on some platforms
+                pass
+            self._spill = None
+
+    def build_pyramid(self, min_size=64, background=True):
+        """
+        Build levels downsampled by 2 with block averaging until the largest
+        dimension drops under min_size, level 0 being the image itself.
+        """
+        image = self._image
+
+        def build():
+            levels = [image]
+            while max(levels[-1].GetDimensions()) >= 2 * min_size:
+                levels.append(downsample_image(levels[-1]))
+                with self._pyramid_lock:
+                    if self._image is not image:
+                        return
+                    self._pyramid = list(levels)
+
+        if background:
+            self._pyramid_thread = threading.Thread(target=build, daemon=True)
+            self._pyramid_thread.start()
+        else:
+            build()
+
+    def is_pyramid_ready(self):
+        return self._pyramid_thread is None or not self._pyramid_thread.is_alive()
+
+    def get_number_of_levels(self):
+        return max(1, len(self._pyramid))
+
+    def get_image(self, level=0):
+        """
+        Image of the pyramid level, the coarsest level built so far if the
+        requested one is not ready yet.
+        """
+        if self._image is None and self._spill is not None:
+            self._restore()
+        if level == 0:
+            return self._image
+        pyramid = self._pyramid
+        if len(pyramid) == 0:
+            return self._image
+        return pyramid[min(level, len(pyramid) - 1)]
+
+    def get_bounds(self):
+        return self.get_image().GetBounds()
+
+    def get_center(self):
+        return self.get_image().GetCenter()
+
+    def get_dimensions(self):
+        return self.get_image().GetDimensions()
+
+    def get_spacing(self):
+        return self.get_image().GetSpacing()
+
+    def get_origin(self):
+        return self.get_image().GetOrigin()
+
+    def probe(self, points, fill_value=0):
+        """
+        Values of the nearest voxels of (N, 3) world positions, fill_value
+        outside the image.
+        """
+        image = self.get_image()
+        scalars = vtk_to_numpy(image.GetPointData().GetScalars())
+        dims = image.GetDimensions()
+        index = self._geometry.world_to_index(np.atleast_2d(points), rounded=True)
+        inside = self._geometry.is_inside(index)
+        flat = index[:, 0] + dims[0] * (index[:, 1] + dims[1] * index[:, 2])
+        values = np.full((len(index),) + scalars.shape[1:], fill_value, dtype=scalars.dtype)
+        values[inside] = scalars[flat[inside]]
+        return values
+
+    def as_array(self, order: str = "C") -> np.ndarray:
+        """
+        Writable view of the scalars, (z, y, x[, components]) with order "C",
+        (x, y, z[, components]) with order "F". Call modified() after writing.
+        """
+        return _order_axes(_image_array(self.get_image()), order)
+
+    def from_array(self, array, spacing=None, origin=None, direction=None, order: str = "C"):
+        """
+        Set the image from an array laid out as for as_array, shared without
+        copy when its memory already has that layout. The geometry not given
+        is kept.
+        """
+        array = np.ascontiguousarray(_order_axes(np.asarray(array), order))
+        if array.ndim not in (3, 4):
+            raise ValueError(f"Invalid image shape:{array.shape}")
+        geometry = self._geometry
+        image = vtkImageData()
+        image.SetDimensions(array.shape[2], array.shape[1], array.shape[0])
+        image.SetSpacing(spacing if spacing is not None else geometry.spacing)
+        image.SetOrigin(origin if origin is not None else geometry.origin)
+        image.SetDirectionMatrix(*(direction if direction is not None else geometry.direction))
+        scalars = numpy_to_vtk(array.reshape(image.GetNumberOfPoints(), -1), deep=0)
+        scalars.SetName("scalars")
+        image.GetPointData().SetScalars(scalars)
+        self.discard_spill()
+        self.set_image(image)
+        self._trigger_modified()
+
+    def _data_modified(self):
+        image = self.get_image()
+        if image is not None:
+            image.GetPointData().GetScalars().Modified()
+            image.Modified()
+            self._image_changed()
+
+
+class LazyImageData(ImageData):
+    """
+    Image reading only the file header at creation, which answers bounds,
+    center, dimensions and spacing. The voxels are read on the first
+    get_image, or ahead of it on the io_manager pool with prefetch.
+    """
+
+    def __init__(self, filename: str = None, use_mmap: bool = False):
+        ImageData.__init__(self)
+        self._load_lock = threading.Lock()
+        self._info = None
+        self._future = None
+        self._prefetch_callbacks = set()
+        self._slice_reader = None
+        if filename:
+            self.read_data(filename, use_mmap)
+
+    def read_data(self, filename: str, use_mmap: bool = False, use_cache: bool = True):
+        self.filename = filename
+        self._use_mmap = use_mmap
+        self._use_cache = use_cache
+        self._image = None
+        self._slice_reader = None
+        self._info = read_image_info(filename)
+        if self._info:
+            self._geometry.set_grid(self._info["dimensions"], self._info["spacing"],
+                                    self._info["origin"])
+            # The seek points of a compressed file are built ahead of the first preview
+            self._open_slice_reader()
+
+    def is_loaded(self):
+        return self._image is not None
+
+    def load(self):
+        if self._image is None:
+            with self._load_lock:
+                if self._image is None and self._spill is not None:
+                    self._restore()
+                elif self._image is None:
+                    ImageData.read_data(self, self.filename,
+                                        self._use_mmap, self._use_cache)
+        return self._image
+
+    def release(self, directory: str):
+        freed = ImageData.release(self, directory)
+        if freed:
+            self._future = None
+        return freed
+
+    def prefetch(self, callback=None):
+        """
+        Read the voxels on a worker thread, return the future.
+        callback() is called on the event loop thread once loaded, for the
+        callbacks of every call.
+        """
+        if self._future is None:
+            self._future = io_manager.submit(self.load)
+            self._prefetch_callbacks = set()
+        # Every caller is called back, once per load, at once if already loaded
+        if callback and (self._future.done() or callback not in self._prefetch_callbacks):
+            self._prefetch_callbacks.add(callback)
+            io_manager.call_on_loop_when_done(self._future, callback)
+        return self._future
+
+    def get_image(self, level=0):
+        self.load()
+        return ImageData.get_image(self, level)
+
+    def _open_slice_reader(self):
+        name = self.filename.lower()
+        if not self._info or not (name.endswith(".nii") or name.endswith(".nii.gz")):
+            return
+        try:
+            self._slice_reader = NiftiSliceReader(self.filename)
+        except ValueError:
+            self._info = None
+            return
+        self._slice_reader.prepare()
+
+    def get_axial_slice(self, z, callback=None):
+        """
+        Axial slice nearest to z read straight from a NIfTI file, before the
+        volume is loaded. None if not available for this file, or while the
+        index of a compressed file is built, callback() being called on the
+        event loop thread once it is.
+        """
+        if self._slice_reader is None or not self._info:
+            return None
+        if not self._slice_reader.is_ready():
+            self._slice_reader.prepare(callback)
+            return None
+        dims, spacing, origin = self._info["dimensions"], self._info["spacing"], self._info["origin"]
+        index = int(round((z - origin[2]) / spacing[2]))
+        if index < 0 or index >= dims[2]:
+            return None
+        voxels = self._slice_reader.read_axial_slice(index)
+        image = vtkImageData()
+        image.SetDimensions(dims[0], dims[1], 1)
+        image.SetSpacing(spacing)
+        image.SetOrigin(origin[0], origin[1], origin[2] + index * spacing[2])
+        image.GetPointData().SetScalars(numpy_to_vtk(voxels.ravel(), deep=1))
+        return image
+
+    def _get_info(self, key):
+        if self._image is None and self._info:
+            return self._info[key]
+        return None
 
-    def get_image(self):
+    def get_bounds(self):
+        return self._get_info("bounds") or self.get_image().GetBounds()
+
+    def get_center(self):
+        bounds = self.get_bounds()
+        return ((bounds[0] + bounds[1]) * 0.5,
+                (bounds[2] + bounds[3]) * 0.5,
+                (bounds[4] + bounds[5]) * 0.5)
+
+    def get_dimensions(self):
+        return self._get_info("dimensions") or self.get_image().GetDimensions()
+
+    def get_spacing(self):
+        return self._get_info("spacing") or self.get_image().GetSpacing()
+
+    def get_origin(self):
+        return self._get_info("origin") or self.get_image().GetOrigin()
+
+
+class TimeSeriesImageData(ImageData):
+    """
+    Frames of a 4D image in one contiguous (time, z, y, x[, components])
+    buffer sharing one geometry. The image holds the scalars of the current
+    frame, set_time_step swaps them for the array of another frame without
+    copying, whatever the number of frames.
+    """
+
+    def __init__(self):
+        ImageData.__init__(self)
+        self.type = DataType.TimeSeries
+        self._frames: np.ndarray = None
+        self._frame_arrays = []
+        self._time_step = 0
+
+    def read_data(self, filenames, use_mmap: bool = False, use_cache: bool = True):
+        """
+        Read one frame per file on the io_manager pool, the geometry is
+        the one of the first file. Called from a worker of the pool, the
+        frames are read in this thread instead of waiting on the pool.
+        """
+        if io_manager.in_worker():
+            reads = [functools.partial(read_image_file, filename, use_mmap, use_cache)
+                     for filename in filenames]
+        else:
+            reads = [io_manager.submit(read_image_file, filename, use_mmap, use_cache).result
+                     for filename in filenames]
+        frames = None
+        for t, read in enumerate(reads):
+            image, _ = read()
+            reads[t] = None
+            if image is None:
+                raise IOError(f"Failed to read {filenames[t]}")
+            if frames is None:
+                self._geometry.set_image(image)
+                frames = np.empty((len(reads),) + _image_array(image).shape,
+                                  dtype=_image_array(image).dtype)
+            frames[t] = _image_array(image)
+        geometry = self._geometry
+        self.set_frames(frames, geometry.spacing, geometry.origin, geometry.direction)
+
+    def set_image(self, image: vtkImageData, memory_mapped: bool = False):
+        self.set_frame_images([image])
+
+    def set_frame_images(self, images):
+        """
+        Copy the scalars of the images into the frame buffer, they must have
+        the dimensions of the first one which gives the geometry.
+        """
+        self._geometry.set_image(images[0])
+        frames = np.empty((len(images),) + _image_array(images[0]).shape,
+                          dtype=_image_array(images[0]).dtype)
+        for t, image in enumerate(images):
+            if image.GetDimensions() != images[0].GetDimensions():
+                raise ValueError(f"Frame {t} dimensions {image.GetDimensions()} differ "
+                                 f"from {images[0].GetDimensions()}")
+            frames[t] = _image_array(image)
+        geometry = self._geometry
+        self.set_frames(frames, geometry.spacing, geometry.origin, geometry.direction)
+
+    def set_frames(self, frames, spacing=(1, 1, 1), origin=(0, 0, 0), direction=None,
+                   memory_mapped: bool = False):
+        """
+        Hold the (time, z, y, x[, components]) array by reference if it is
+        C contiguous.
+        """
+        frames = np.ascontiguousarray(frames)
+        if frames.ndim not in (4, 5) or len(frames) == 0:
+            raise ValueError(f"Invalid time series shape:{frames.shape}")
+        image = vtkImageData()
+        image.SetDimensions(frames.shape[3], frames.shape[2], frames.shape[1])
+        image.SetSpacing(spacing)
+        image.SetOrigin(origin)
+        if direction is not None:
+            image.SetDirectionMatrix(*direction)
+        self._frame_arrays = []
+        for frame in frames:
+            array = numpy_to_vtk(frame.reshape(image.GetNumberOfPoints(), -1), deep=0)
+            array.SetName("scalars")
+            self._frame_arrays.append(array)
+        self._frames = frames
+        self._time_step = min(self._time_step, len(frames) - 1)
+        image.GetPointData().SetScalars(self._frame_arrays[self._time_step])
+        ImageData.set_image(self, image, memory_mapped)
+
+    def _image_changed(self):
+        # The pyramid of one frame would not follow the time step
+        if self._image:
+            self._geometry.set_image(self._image)
+
+    def get_image(self, level=0):
+        if self._image is None and self._spill is not None:
+            self._restore()
         return self._image
 
+    def get_number_of_time_steps(self):
+        if self._frames is None and self._spill is not None:
+            return self._spill[1]
+        return len(self._frame_arrays)
+
+    def get_time_step(self):
+        return self._time_step
+
+    def set_time_step(self, time_step: int):
+        """
+        Show the frame of the time step, clamped to the series.
+        """
+        image = self.get_image()
+        if image is None:
+            return
+        time_step = min(max(int(time_step), 0), len(self._frame_arrays) - 1)
+        if time_step != self._time_step:
+            self._time_step = time_step
+            image.GetPointData().SetScalars(self._frame_arrays[time_step])
+
+    def get_frames(self) -> np.ndarray:
+        """
+        The (time, z, y, x[, components]) buffer, by reference.
+        """
+        self.get_image()
+        return self._frames
+
+    def get_frame(self, time_step: int) -> vtkImageData:
+        """
+        New image sharing the geometry and the scalars of the time step.
+        """
+        image = vtkImageData()
+        image.CopyStructure(self.get_image())
+        image.GetPointData().SetScalars(self._frame_arrays[time_step])
+        return image
+
+    def get_memory_size(self):
+        if self._frames is None or self._memory_mapped:
+            return 0
+        return self._frames.nbytes
+
+    def release(self, directory: str):
+        if self._frames is None or self._memory_mapped:
+            return 0
+        size = self.get_memory_size()
+        self.discard_spill()
+        path = os.path.join(directory, uuid.uuid4().hex + ".npy")
+        np.save(path, self._frames)
+        geometry = self._geometry
+        self._spill = (path, len(self._frames),
+                       (list(geometry.spacing), list(geometry.origin), list(geometry.direction)))
+        self._frames = None
+        self._frame_arrays = []
+        self._image = None
+        return size
+
+    def _restore(self):
+        path, _, geometry = self._spill
+        self.set_frames(np.load(path, mmap_mode="c"), *geometry, memory_mapped=True)
+
+
+def _image_array(image: vtkImageData) -> np.ndarray:
+    """
+    Scalars of the image as a (z, y, x[, components]) array.
+    """
+    dims = image.GetDimensions()
+    scalars = vtk_to_numpy(image.GetPointData().GetScalars())
+    return scalars.reshape((dims[2], dims[1], dims[0]) + scalars.shape[1:])
+
+
+def _order_axes(array: np.ndarray, order: str) -> np.ndarray:
+    """
+    Swap the (z, y, x) and (x, y, z) orders of the first three axes for "F".
+    """
+    if order == "F":
+        return array.transpose((2, 1, 0) + tuple(range(3, array.ndim)))
+    if order != "C":
+        raise ValueError(f"Unsupported order:{order}")
+    return array
+
+
+class LabelMapData(ImageData):
+    """
+    Segmentation labels stored as uint8, uint16 past 255, optionally run
+    length encoded per axial slice. Voxel counts and bounding boxes of the
+    labels are computed once per change, get_slice decodes one slice and
+    get_image the whole volume, kept until the labels change or release.
+    """
+
+    def __init__(self, compressed: bool = False):
+        ImageData.__init__(self)
+        self.type = DataType.LabelMap
+        self._compressed = compressed
+        # (z, y, x) labels, None when compressed
+        self._labels: np.ndarray = None
+        # (values, lengths) runs of every axial slice when compressed
+        self._runs = []
+        self._dtype = np.uint8
+        # label: (voxel count, [i0, i1, j0, j1, k0, k1] voxel bounding box)
+        self._statistics = None
+        self._version = 0
+
+    def read_data(self, filename: str, use_mmap: bool = False, use_cache: bool = True):
+        image, _ = read_image_file(filename, use_mmap, use_cache)
+        if image is None:
+            raise IOError(f"Failed to read {filename}")
+        self.set_image(image)
+
+    def set_image(self, image: vtkImageData, memory_mapped: bool = False):
+        """
+        Copy the labels of the image, its geometry is kept.
+        """
+        self._geometry.set_image(image)
+        geometry = self._geometry
+        self.set_labels(_image_array(image), geometry.spacing, geometry.origin,
+                        geometry.direction)
+
+    def set_labels(self, labels, spacing=(1, 1, 1), origin=(0, 0, 0), direction=None):
+        """
+        Set the (z, y, x) integer labels, converted to the smallest of uint8
+        and uint16 holding them.
+        """
+        labels = np.asarray(labels)
+        if not np.issubdtype(labels.dtype, np.integer):
+            labels = np.rint(labels)
+        if labels.ndim != 3:
+            raise ValueError(f"Invalid label map shape:{labels.shape}")
+        if labels.size and (labels.min() < 0 or labels.max() > 65535):
+            raise ValueError("Labels must be in [0, 65535]")
+        self._dtype = np.uint8 if labels.size == 0 or labels.max() < 256 else np.uint16
+        self._geometry.set_grid(labels.shape[::-1], spacing, origin, direction)
+        self.discard_spill()
+        if self._compressed:
+            self._labels = None
+            self._runs = [_encode_runs(labels[k].astype(self._dtype, copy=False))
+                          for k in range(labels.shape[0])]
+        else:
+            self._labels = np.ascontiguousarray(labels, dtype=self._dtype)
+            self._runs = []
+        self._labels_changed()
+
+    def _labels_changed(self):
+        self._image = None
+        self._memory_mapped = False
+        self._statistics = None
+        self._version += 1
+
+    def get_version(self):
+        """
+        Counter increased on every change of the labels.
+        """
+        return self._version
+
+    def _data_modified(self):
+        if self._image is not None:
+            self._image.GetPointData().GetScalars().Modified()
+            self._image.Modified()
+            if self._labels is None:
+                # Edits went to the decoded copy of compressed labels
+                labels = _image_array(self._image)
+                self._runs = [_encode_runs(labels[k]) for k in range(len(labels))]
+        self._statistics = None
+        self._version += 1
+
+    def _image_changed(self):
+        pass
+
+    def is_compressed(self):
+        return self._compressed
+
+    def set_compressed(self, compressed: bool):
+        if compressed != self._compressed:
+            labels = self.get_labels()
+            self._compressed = compressed
+            geometry = self._geometry
+            self.set_labels(labels, geometry.spacing, geometry.origin, geometry.direction)
+
+    def get_labels(self) -> np.ndarray:
+        """
+        The (z, y, x) labels, decoded if compressed.
+        """
+        if self._labels is None and self._spill is not None:
+            self._restore()
+        if self._labels is not None:
+            return self._labels
+        labels = np.empty(self._geometry.dimensions[::-1], dtype=self._dtype)
+        for k in range(len(self._runs)):
+            labels[k] = self._decode_slice(k)
+        return labels
+
+    def _decode_slice(self, k):
+        values, lengths = self._runs[k]
+        dims = self._geometry.dimensions
+        return np.repeat(values, lengths).reshape(dims[1], dims[0])
+
+    def get_slice(self, axis: int, index: int) -> np.ndarray:
+        """
+        Labels of the slice normal to the x (0), y (1) or z (2) axis, the
+        remaining axes kept in (z, y, x) order. Only the slice is decoded
+        for z, the slices are decoded one at a time otherwise.
+        """
+        if self._labels is None and self._spill is not None:
+            self._restore()
+        if self._labels is not None:
+            return self._labels[(slice(None),) * (2 - axis) + (index,)]
+        if axis == 2:
+            return self._decode_slice(index)
+        return np.stack([self._decode_slice(k)[(slice(None),) * (1 - axis) + (index,)]
+                         for k in range(len(self._runs))])
+
+    def get_image(self, level=0):
+        """
+        The labels as an image, sharing their memory when not compressed.
+        """
+        if self._image is None and (self._labels is not None or self._runs or self._spill):
+            labels = self.get_labels()
+            image = vtkImageData()
+            geometry = self._geometry
+            image.SetDimensions(geometry.dimensions)
+            image.SetSpacing(geometry.spacing)
+            image.SetOrigin(geometry.origin)
+            image.SetDirectionMatrix(*geometry.direction)
+            array = numpy_to_vtk(labels.ravel(), deep=0)
+            array.SetName("labels")
+            image.GetPointData().SetScalars(array)
+            self._image = image
+        return self._image
+
+    def _get_statistics(self):
+        if self._statistics is None:
+            if self._labels is None and self._spill is not None:
+                self._restore()
+            dims = self._geometry.dimensions
+            statistics = {}
+            for k in range(dims[2]):
+                flat = (self._labels[k] if self._labels is not None
+                        else self._decode_slice(k)).ravel()
+                foreground = np.flatnonzero(flat)
+                if len(foreground) == 0:
+                    continue
+                labels = flat[foreground]
+                order = np.argsort(labels, kind="stable")
+                labels, foreground = labels[order], foreground[order]
+                values, starts, counts = np.unique(
+                    labels, return_index=True, return_counts=True)
+                rows, columns = np.divmod(foreground, dims[0])
+                i0 = np.minimum.reduceat(columns, starts)
+                i1 = np.maximum.reduceat(columns, starts)
+                j0, j1 = rows[starts], rows[np.r_[starts[1:], len(rows)] - 1]
+                for n, label in enumerate(values.tolist()):
+                    box = [int(i0[n]), int(i1[n]), int(j0[n]), int(j1[n]), k, k]
+                    if label in statistics:
+                        count, old = statistics[label]
+                        box = [min(box[0], old[0]), max(box[1], old[1]),
+                               min(box[2], old[2]), max(box[3], old[3]), old[4], k]
+                        statistics[label] = (count + int(counts[n]), box)
+                    else:
+                        statistics[label] = (int(counts[n]), box)
+            self._statistics = statistics
+        return self._statistics
+
+    def get_label_values(self):
+        """
+        Sorted labels present, 0 is the background and not listed.
+        """
+        return sorted(self._get_statistics())
+
+    def get_voxel_count(self, label: int):
+        statistics = self._get_statistics().get(label)
+        return statistics[0] if statistics else 0
+
+    def get_label_extent(self, label: int):
+        """
+        Voxel bounding box [i0, i1, j0, j1, k0, k1] of the label, None if absent.
+        """
+        statistics = self._get_statistics().get(label)
+        return list(statistics[1]) if statistics else None
+
+    def get_label_bounds(self, label: int):
+        """
+        World bounds of the voxel centers of the label, None if absent.
+        """
+        extent = self.get_label_extent(label)
+        if extent is None:
+            return None
+        corners = self._geometry.index_to_world(
+            [[extent[i], extent[2 + j], extent[4 + k]]
+             for i in (0, 1) for j in (0, 1) for k in (0, 1)])
+        minimum, maximum = corners.min(axis=0).tolist(), corners.max(axis=0).tolist()
+        return [minimum[0], maximum[0], minimum[1], maximum[1], minimum[2], maximum[2]]
+
     def get_bounds(self):
-        return self._image.GetBounds()
+        return self._geometry.get_bounds()
 
     def get_center(self):
-        return self._image.GetCenter()
+        bounds = self._geometry.get_bounds()
+        return [(bounds[2 * i] + bounds[2 * i + 1]) * 0.5 for i in range(3)]
+
+    def get_dimensions(self):
+        return tuple(self._geometry.dimensions)
+
+    def get_spacing(self):
+        return tuple(self._geometry.spacing)
+
+    def get_origin(self):
+        return tuple(self._geometry.origin)
+
+    def get_memory_size(self):
+        size = 0
+        if self._labels is not None and not self._memory_mapped:
+            size += self._labels.nbytes
+        if self._labels is None and self._image is not None:
+            # Decoded copy of compressed labels
+            size += self._image.GetActualMemorySize() * 1024
+        return size + sum(values.nbytes + lengths.nbytes for values, lengths in self._runs)
+
+    def release(self, directory: str):
+        """
+        Drop the decoded image of compressed labels, spill the labels otherwise.
+        """
+        if self._labels is None:
+            size = self.get_memory_size()
+            self._image = None
+            return size - self.get_memory_size()
+        if self._memory_mapped:
+            return 0
+        size = self.get_memory_size()
+        self.discard_spill()
+        path = os.path.join(directory, uuid.uuid4().hex + ".npy")
+        np.save(path, self._labels)
+        self._spill = (path,)
+        self._labels = None
+        self._image = None
+        return size
+
+    def _restore(self):
+        self._labels = np.load(self._spill[0], mmap_mode="c")
+        self._image = None
+        self._memory_mapped = True
+
+
+def _encode_runs(labels: np.ndarray):
+    """
+    (values, lengths) runs of the flattened labels.
+    """
+    flat = labels.ravel()
+    starts = np.r_[0, np.flatnonzero(flat[1:] != flat[:-1]) + 1]
+    lengths = np.diff(np.r_[starts, len(flat)]).astype(np.uint32)
+    return flat[starts], lengths
 
 
 class SurfaceData(BaseData):
     def __init__(self):
+        BaseData.__init__(self)
         self.type = DataType.Surface
         self._geometry = Geometry()
         self._polydata: vtkPolyData = None
+        # Scratch file of the released polydata
+        self._spill = None
+        self._cut_index: SurfaceCutIndex = None
 
-    def read_data(self, filename: str):
-        self._polydata = load_surface(filename)
+    def read_data(self, filename: str, use_cache: bool = True):
+        self._polydata = load_surface(filename, use_cache)
 
     def get_bounds(self):
-        return self._polydata.GetBounds()
+        return self.get_polydata().GetBounds()
 
     def get_center(self):
-        return self._polydata.GetCenter()
+        return self.get_polydata().GetCenter()
+
+    def get_memory_size(self):
+        if self._polydata is None:
+            return 0
+        size = self._polydata.GetActualMemorySize() * 1024
+        if self._cut_index is not None:
+            size += self._cut_index.get_memory_size()
+        return size
+
+    def release(self, directory: str):
+        if self._polydata is None:
+            return 0
+        size = self.get_memory_size()
+        self.discard_spill()
+        self._spill = os.path.join(directory, uuid.uuid4().hex + ".vtp")
+        save_surface(self._polydata, self._spill, compression="none")
+        self._polydata = None
+        self._cut_index = None
+        return size
+
+    def _restore(self):
+        self._polydata = load_surface(self._spill, use_cache=False)
+
+    def discard_spill(self):
+        if self._spill is not None:
+            try:
+                os.remove(self._spill)
+            except OSError:
+                pass
+            self._spill = None
 
     def read_byte(self, type, intput):
         if type == "vtp":
@@ -94,14 +930,195 @@ class SurfaceData(BaseData):
             self._polydata = reader.GetOutput()
 
     def get_polydata(self):
+        if self._polydata is None and self._spill is not None:
+            self._restore()
+        return self._polydata
+
+    def get_cut_index(self) -> SurfaceCutIndex:
+        """
+        Index of the cells for plane cuts, built again once the polydata changed.
+        """
+        polydata = self.get_polydata()
+        if polydata is None:
+            return None
+        index = self._cut_index
+        if index is None or index.polydata is not polydata or index.mtime != polydata.GetMTime():
+            index = self._cut_index = SurfaceCutIndex(polydata)
+        return index
+
+    def as_array(self, name: str = None) -> np.ndarray:
+        """
+        Writable (n, 3) view of the points, or of the point data array name.
+        Call modified() after writing.
+        """
+        polydata = self.get_polydata()
+        if name is None:
+            return vtk_to_numpy(polydata.GetPoints().GetData())
+        array = polydata.GetPointData().GetArray(name)
+        if array is None:
+            raise ValueError(f"No point data array named {name}")
+        return vtk_to_numpy(array)
+
+    def from_array(self, points, faces=None):
+        """
+        Set the (n, 3) points and the (m, k) point indices of the faces,
+        shared without copy when contiguous float32/float64 and int64.
+        The faces are kept if not given, the number of points must not change.
+        With faces the surface is a new polydata holding only them, the point
+        data is kept if the number of points did not change, the cell data and
+        other cells are dropped.
+        """
+        points = np.asarray(points)
+        if points.dtype not in (np.float32, np.float64):
+            points = points.astype(np.float64)
+        points = np.ascontiguousarray(points)
+        if points.ndim != 2 or points.shape[1] != 3:
+            raise ValueError(f"Invalid points shape:{points.shape}")
+        if faces is not None:
+            faces = np.ascontiguousarray(faces, dtype=np.int64)
+            if faces.ndim != 2:
+                raise ValueError(f"Invalid faces shape:{faces.shape}")
+        old = self.get_polydata()
+        if faces is None and old is not None:
+            if old.GetNumberOfPoints() != len(points):
+                raise ValueError(f"{len(points)} points given for a surface of "
+                                 f"{old.GetNumberOfPoints()}, faces are needed")
+            polydata = old
+        else:
+            polydata = vtkPolyData()
+            if old is not None and old.GetNumberOfPoints() == len(points):
+                polydata.GetPointData().ShallowCopy(old.GetPointData())
+        if faces is not None:
+            polys = vtkCellArray()
+            polys.SetData(numpy_to_vtkIdTypeArray(
+                np.arange(0, faces.size + 1, faces.shape[1], dtype=np.int64), deep=1),
+                numpy_to_vtkIdTypeArray(faces.ravel(), deep=0))
+            polydata.SetPolys(polys)
+        vtk_points = vtkPoints()
+        vtk_points.SetData(numpy_to_vtk(points, deep=0))
+        polydata.SetPoints(vtk_points)
+        self.discard_spill()
+        self._polydata = polydata
+        self._trigger_modified()
+
+    def _data_modified(self):
+        polydata = self.get_polydata()
+        if polydata is not None:
+            polydata.GetPoints().Modified()
+            point_data = polydata.GetPointData()
+            for i in range(point_data.GetNumberOfArrays()):
+                point_data.GetArray(i).Modified()
+            polydata.Modified()
+
+
+class LazySurfaceData(SurfaceData):
+    """
+    Surface read on the first access to its polydata, or ahead of it on the
+    io_manager pool with prefetch. Surface files have no header giving the
+    bounds, they are None until the surface was loaded once.
+    """
+
+    def __init__(self, filename: str = None):
+        SurfaceData.__init__(self)
+        self._load_lock = threading.Lock()
+        self._future = None
+        self._prefetch_callbacks = set()
+        self._bounds = None
+        if filename:
+            self.read_data(filename)
+
+    def read_data(self, filename: str, use_cache: bool = True):
+        self.filename = filename
+        self._use_cache = use_cache
+        self._polydata = None
+        self._bounds = None
+
+    def is_loaded(self):
+        return self._polydata is not None
+
+    def load(self):
+        if self._polydata is None:
+            with self._load_lock:
+                if self._polydata is None and self._spill is not None:
+                    self._restore()
+                elif self._polydata is None:
+                    SurfaceData.read_data(self, self.filename, self._use_cache)
         return self._polydata
 
+    def release(self, directory: str):
+        if self._polydata is not None:
+            self._bounds = self._polydata.GetBounds()
+        freed = SurfaceData.release(self, directory)
+        if freed:
+            self._future = None
+        return freed
+
+    def prefetch(self, callback=None):
+        """
+        Read the surface on a worker thread, return the future.
+        callback() is called on the event loop thread once loaded, for the
+        callbacks of every call.
+        """
+        if self._future is None:
+            self._future = io_manager.submit(self.load)
+            self._prefetch_callbacks = set()
+        # Every caller is called back, once per load, at once if already loaded
+        if callback and (self._future.done() or callback not in self._prefetch_callbacks):
+            self._prefetch_callbacks.add(callback)
+            io_manager.call_on_loop_when_done(self._future, callback)
+        return self._future
+
+    def get_polydata(self):
+        return self.load()
+
+    def get_bounds(self):
+        """
+        Bounds of the surface, None while it is not loaded and was never
+        loaded, prefetch is started then.
+        """
+        if self._polydata is not None:
+            return self._polydata.GetBounds()
+        if self._bounds is None:
+            self.prefetch()
+        return self._bounds
+
+    def get_center(self):
+        bounds = self.get_bounds()
+        if bounds is None:
+            return None
+        return ((bounds[0] + bounds[1]) * 0.5,
+                (bounds[2] + bounds[3]) * 0.5,
+                (bounds[4] + bounds[5]) * 0.5)
+
 
 class PointSetData(BaseData):
+    """
+    Point set stored in a (capacity, 3) float64 array growing by doubling,
+    the first len(self) rows are shared with the vtkPoints without copy.
+    Optional per point attributes, e.g. "labels", "radii", "colors" or
+    "selected", are arrays of the same length created when first set.
+    """
+    ATTRIBUTE_TYPES = {
+        "labels": np.int32,
+        "radii": np.float32,
+        "colors": np.uint8,
+        "selected": np.uint8,
+    }
+    # Attributes of several components, "colors" being RGB in [0, 255]
+    ATTRIBUTE_COMPONENTS = {
+        "colors": 3,
+    }
+
     def __init__(self):
+        BaseData.__init__(self)
         self.type = DataType.PointSet
-        self.geometry = Geometry()
+        self._geometry = Geometry()
         self._pointset: vtkPoints = vtkPoints()
+        self._buffer = np.zeros((0, 3))
+        self._attributes = {}
+        self._size = 0
+        self._polydata = None
+        self._points_changed(resized=True)
 
     def read_data(self, filename: str):
         pass
@@ -109,56 +1126,227 @@ class PointSetData(BaseData):
     def read_byte(self, type, intput):
         pass
 
+    def _reserve(self, size):
+        capacity = len(self._buffer)
+        if size <= capacity:
+            return
+        capacity = max(size, 2 * capacity, 16)
+        buffer = np.zeros((capacity, 3))
+        buffer[:self._size] = self._buffer[:self._size]
+        self._buffer = buffer
+        for name, values in self._attributes.items():
+            grown = np.zeros((capacity,) + values.shape[1:], dtype=values.dtype)
+            grown[:self._size] = values[:self._size]
+            self._attributes[name] = grown
+
+    def _points_changed(self, resized=False):
+        if resized:
+            self._pointset.SetData(numpy_to_vtk(self._buffer[:self._size], deep=0))
+            self._polydata = None
+        else:
+            self._pointset.GetData().Modified()
+            self._pointset.Modified()
+
     def get_pointset(self):
         return self._pointset
-    
+
+    def get_points(self) -> np.ndarray:
+        """
+        (n, 3) view of the points, call update_points to change them.
+        """
+        return self._buffer[:self._size]
+
     def get_points_array(self):
-        return vtkDataArrayToVTKArray(self._pointset.GetData())
+        return self.get_points()
+
+    def as_array(self) -> np.ndarray:
+        """
+        Writable (n, 3) view of the points, call modified() after writing.
+        """
+        return self.get_points()
+
+    def from_array(self, points, **attributes):
+        """
+        Replace the points by the (n, 3) array, used as the storage without
+        copy when it is contiguous float64 until the set grows, and set the
+        given attributes.
+        """
+        points = np.ascontiguousarray(points, dtype=np.float64)
+        if points.ndim != 2 or points.shape[1] != 3:
+            raise ValueError(f"Invalid points shape:{points.shape}")
+        self._buffer = points
+        self._size = len(points)
+        self._attributes = {}
+        for name, values in attributes.items():
+            self.set_attribute(name, values)
+        self._points_changed(resized=True)
+        self._trigger_modified()
+
+    def _data_modified(self):
+        if self._polydata is not None:
+            point_data = self._polydata.GetPointData()
+            for i in range(point_data.GetNumberOfArrays()):
+                point_data.GetArray(i).Modified()
+        self._points_changed()
+
+    def get_memory_size(self):
+        return self._buffer.nbytes + sum(x.nbytes for x in self._attributes.values())
 
     def get_point(self, index):
-        if index < self._pointset.GetNumberOfPoints():
-            return self._pointset.GetPoint(index)
+        if index < self._size:
+            return tuple(self._buffer[index].tolist())
         raise ValueError("{} is out of range!".format(index))
 
     def set_point(self, index, point):
-        if index < self._pointset.GetNumberOfPoints():
-            self._pointset.SetPoint(index, point)
+        if index < self._size:
+            self.update_points([index], [point])
         else:
             raise ValueError("{} is out of range!".format(index))
 
     def add_point(self, point):
-        self._pointset.InsertNextPoint(point)
+        return self.add_points([point])[0]
+
+    def add_points(self, points, **attributes):
+        """
+        Append (n, 3) points, attributes are given as name=values, return their indices.
+        """
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 3)
+        start, end = self._size, self._size + len(points)
+        self._reserve(end)
+        self._buffer[start:end] = points
+        self._size = end
+        for name, values in self._attributes.items():
+            if name not in attributes:
+                values[start:end] = 0
+        for name, values in attributes.items():
+            self.set_attribute(name, values, np.arange(start, end))
+        self._points_changed(resized=True)
+        return np.arange(start, end)
+
+    def update_points(self, indices, points):
+        indices = np.asarray(indices)
+        if len(indices) and (indices.max() >= self._size or indices.min() < -self._size):
+            raise ValueError("{} is out of range!".format(indices))
+        self._buffer[:self._size][indices] = np.asarray(points, dtype=np.float64).reshape(-1, 3)
+        self._points_changed()
+
+    def remove_points(self, indices):
+        keep = np.ones(self._size, dtype=bool)
+        keep[np.asarray(indices, dtype=np.int64)] = False
+        size = int(keep.sum())
+        self._buffer[:size] = self._buffer[:self._size][keep]
+        for values in self._attributes.values():
+            values[:size] = values[:self._size][keep]
+        self._size = size
+        self._points_changed(resized=True)
+
+    def set_attribute(self, name, values, indices=None):
+        """
+        Set the attribute of the points of indices, of all points if None.
+        """
+        if name not in self._attributes:
+            dtype = PointSetData.ATTRIBUTE_TYPES.get(name, np.asarray(values).dtype)
+            components = PointSetData.ATTRIBUTE_COMPONENTS.get(name)
+            shape = (components,) if components else np.shape(values)[1:]
+            self._attributes[name] = np.zeros((len(self._buffer),) + shape, dtype=dtype)
+            self._polydata = None
+        if indices is None:
+            indices = slice(0, self._size)
+        self._attributes[name][:self._size][indices] = values
+        if self._polydata is not None:
+            self._polydata.GetPointData().GetArray(name).Modified()
+        self._pointset.Modified()
+
+    def get_attribute(self, name):
+        values = self._attributes.get(name)
+        if values is None:
+            return None
+        return values[:self._size]
+
+    def get_attribute_names(self):
+        return list(self._attributes.keys())
+
+    def get_polydata(self) -> vtkPolyData:
+        """
+        Polydata of the points with the attributes as point data, sharing their
+        memory. The same one is returned until points are added or removed or
+        an attribute is created.
+        """
+        if self._polydata is None:
+            polydata = vtkPolyData()
+            polydata.SetPoints(self._pointset)
+            for name in self._attributes:
+                array = numpy_to_vtk(self.get_attribute(name), deep=0)
+                array.SetName(name)
+                polydata.GetPointData().AddArray(array)
+            self._polydata = polydata
+        return self._polydata
 
     def clear(self):
-        self._pointset.Reset()
+        self._size = 0
+        self._points_changed(resized=True)
 
     def to_list(self):
-        results = []
-        for i in range(self._pointset.GetNumberOfPoints()):
-            result = {}
-            result["id"] = i
-            p = self._pointset.GetPoint(i)
-            result["position_x"] = p[0]
-            result["position_y"] = p[1]
-            result["position_z"] = p[2]
-            result["position"] = p
-            results.append(result)
-        return results
+        return [{"id": i, "position_x": p[0], "position_y": p[1], "position_z": p[2],
+                 "position": tuple(p)}
+                for i, p in enumerate(self.get_points().tolist())]
+
+    def to_columns(self):
+        """
+        Columns of ids, coordinates and attributes as lists, for the UI state.
+        """
+        points = self.get_points()
+        columns = {
+            "id": list(range(self._size)),
+            "position_x": points[:, 0].tolist(),
+            "position_y": points[:, 1].tolist(),
+            "position_z": points[:, 2].tolist(),
+        }
+        for name in self._attributes:
+            columns[name] = self.get_attribute(name).tolist()
+        return columns
 
     def __len__(self):
-        return self._pointset.GetNumberOfPoints()
+        return self._size
 
     def get_bounds(self):
-        return self._pointset.GetBounds()
+        if self._size == 0:
+            return self._pointset.GetBounds()
+        points = self.get_points()
+        minimum, maximum = points.min(axis=0).tolist(), points.max(axis=0).tolist()
+        return (minimum[0], maximum[0], minimum[1], maximum[1], minimum[2], maximum[2])
 
     def get_center(self):
-        bounds = self._pointset.GetBounds()
+        bounds = self.get_bounds()
         return [(bounds[0]+bounds[1])*0.5,
                 (bounds[2]+bounds[3])*0.5,
                 (bounds[4]+bounds[5])*0.5,]
 
 
+class _AllKeys:
+    """
+    Contains every key, the modified keys for a consumer never synchronised.
+    """
+
+    def __contains__(self, key):
+        return True
+
+
+ALL_KEYS = _AllKeys()
+
+
 class DataNode:
+    """
+    Data node, the data and its properties.
+    Every property change bumps the node version and records it as the
+    version of the key, consumers keep the version they last synchronised
+    with and ask for the keys modified since.
+    """
+    # Properties indexed by the data storage holding the node
+    INDEXED_PROPERTIES = frozenset(["name", "layer", "view_layer"])
+    # Properties keeping the data in memory under a memory budget
+    PINNING_PROPERTIES = frozenset(["visible", "activate"])
+
     def __init__(self, name="undefined"):
         self.properties = {
             "visible": True,
@@ -173,53 +1361,229 @@ class DataNode:
         self.parent = None
         self.mappers = {}
         self.data: BaseData = None
+        self.data_storage = None
+        self._version = 0
+        self._versions = {}
 
     def set_data(self, data: BaseData):
-        self.data = data
+        if self.data is not None:
+            self.data.remove_modified_callback(self._data_modified)
+        data.add_modified_callback(self._data_modified)
+        self._update_indexed(True, lambda: setattr(self, "data", data))
+        self._update_pinned()
         data_manager.add_data(data, self.get("id"))
+        if self.data_storage is not None:
+            self.data_storage.invalidate_bounds(self.get("id"))
+            data_manager.enforce_budget()
 
     def get_data(self):
         return data_manager.get_data(self.get("id"))
 
+    def _data_modified(self):
+        if self.data_storage is not None:
+            self.data_storage.modefied(self.get("id"))
+
+    def _update_indexed(self, indexed, update):
+        if indexed and self.data_storage is not None:
+            self.data_storage._unindex_node(self)
+            update()
+            self.data_storage._index_node(self)
+        else:
+            update()
+
     def __getitem__(self, key):
         return self.properties.get(key)
 
     def __setitem__(self, key, value):
-        self.properties[key] = value
+        self.touch(key)
+        if key in DataNode.INDEXED_PROPERTIES and self.data_storage is not None:
+            self._update_indexed(
+                True, lambda: self.properties.__setitem__(key, value))
+        else:
+            self.properties[key] = value
+            if key == "visible" and self.data_storage is not None:
+                self.data_storage.invalidate_bounds(self.get("id"))
+        if key in DataNode.PINNING_PROPERTIES:
+            self._update_pinned()
 
     def __delitem__(self, key):
-        del self.properties[key]
+        self.touch(key)
+        self._update_indexed(key in DataNode.INDEXED_PROPERTIES,
+                             lambda: self.properties.__delitem__(key))
+        if key == "visible" and self.data_storage is not None:
+            self.data_storage.invalidate_bounds(self.get("id"))
+        if key in DataNode.PINNING_PROPERTIES:
+            self._update_pinned()
 
     def update(self, items: Dict):
-        self.properties.update(Dict)
+        self.touch(*items)
+        self._update_indexed(not DataNode.INDEXED_PROPERTIES.isdisjoint(items),
+                             lambda: self.properties.update(items))
+        if "visible" in items and self.data_storage is not None:
+            self.data_storage.invalidate_bounds(self.get("id"))
+        if not DataNode.PINNING_PROPERTIES.isdisjoint(items):
+            self._update_pinned()
+
+    def _update_pinned(self):
+        # The data of visible or active nodes stays in memory
+        data_manager.set_pinned(self.get("id"),
+                                bool(self.get("visible") or self.get("activate")))
 
     def get(self, key, default=None):
         return self.properties.get(key, default)
 
     def pop(self, key, default=None):
-        self.pop(key, default)
+        if key not in self.properties:
+            return default
+        value = self.properties[key]
+        self.__delitem__(key)
+        return value
+
+    def touch(self, *keys):
+        """
+        Mark the properties as modified, needed after changing a value in place.
+        """
+        self._version += 1
+        for key in keys:
+            self._versions[key] = self._version
+
+    def get_version(self, key=None):
+        if key is None:
+            return self._version
+        return self._versions.get(key, 0)
+
+    def get_modified_keys(self, since: int):
+        """
+        Keys modified after the version since, every key if since is negative.
+        """
+        if since < 0:
+            return ALL_KEYS
+        if self._version <= since:
+            return set()
+        return set(key for key, version in self._versions.items() if version > since)
+
+
+def _layer_value(value):
+    # view_layer is a string id when set by the pipeline manager
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return 0
 
 
 class DataStorage:
+    """
+    Data storage, a tree of data nodes.
+    Nodes are indexed by name, data type and parent as they are added and
+    removed, and kept sorted by (layer, view_layer) per data type for
+    get_top_node. Changing an indexed property or the data of a node
+    updates the indexes through DataNode.
+    The bounds of the visible nodes are cached along with their union,
+    call invalidate_bounds or modefied after changing data in place.
+    Inside batch() the node events are deferred and merged, see batch.
+    """
     class DataStorageEvent(Enum):
         ADD_NODE = 0,
         REMOVE_NODE = 1,
-        MODIFIED_NODE = 3
+        MODIFIED_NODE = 3,
+        BATCH = 4
 
     def __init__(self):
         self.nodes: Dict[uuid.UUID, DataNode] = {}
         self.children_map = defaultdict(set)
+        self._name_index = defaultdict(dict)
+        self._type_index = defaultdict(dict)
+        # Sorted (layer, view_layer, -sequence, id) per data type,
+        # DataType.Undefined holds every node
+        self._layer_index = defaultdict(list)
+        self._index_keys = {}
+        self._sequences = {}
+        self._next_sequence = 0
+        # Bounds of the visible nodes, the ones to compute and their union,
+        # None when it has to be computed again
+        self._node_bounds = {}
+        self._dirty_bounds = set()
+        self._bounds = None
         self._callbacks = {
             DataStorage.DataStorageEvent.ADD_NODE: [],
             DataStorage.DataStorageEvent.REMOVE_NODE: [],
-            DataStorage.DataStorageEvent.MODIFIED_NODE: []
+            DataStorage.DataStorageEvent.MODIFIED_NODE: [],
+            DataStorage.DataStorageEvent.BATCH: []
         }
+        self._batch_depth = 0
+        self._batch_events = None
+        self._sending_batch = False
 
     def trigger_callbacks(self, event_name, *args, **kwargs):
+        if self._batch_depth and event_name != DataStorage.DataStorageEvent.BATCH:
+            self._record_batch_event(event_name, args, kwargs)
+            return
         if event_name in self._callbacks:
             for callback in self._callbacks[event_name]:
                 callback(*args, **kwargs)
 
+    @contextmanager
+    def batch(self):
+        """
+        Defer the node events until the outermost batch exits, then send the
+        merged node events followed by one BATCH event with the lists of
+        added, removed and modified ids.
+        A node added then removed in the batch is not reported, the
+        modifications of an added node are part of its addition.
+        """
+        if self._batch_depth == 0:
+            self._batch_events = {
+                DataStorage.DataStorageEvent.REMOVE_NODE: {},
+                DataStorage.DataStorageEvent.ADD_NODE: {},
+                DataStorage.DataStorageEvent.MODIFIED_NODE: {},
+            }
+        self._batch_depth += 1
+        try:
+            yield self
+        finally:
+            self._batch_depth -= 1
+            if self._batch_depth == 0:
+                events, self._batch_events = self._batch_events, None
+                self._send_batch_events(events)
+
+    def _record_batch_event(self, event_name, args, kwargs):
+        removed = self._batch_events[DataStorage.DataStorageEvent.REMOVE_NODE]
+        added = self._batch_events[DataStorage.DataStorageEvent.ADD_NODE]
+        modified = self._batch_events[DataStorage.DataStorageEvent.MODIFIED_NODE]
+        if event_name == DataStorage.DataStorageEvent.ADD_NODE:
+            added[args[0].get("id")] = (args, kwargs)
+        elif event_name == DataStorage.DataStorageEvent.REMOVE_NODE:
+            _id = args[0]
+            modified.pop(_id, None)
+            if added.pop(_id, None) is None:
+                removed[_id] = (args, kwargs)
+        elif event_name == DataStorage.DataStorageEvent.MODIFIED_NODE:
+            if args[0] not in added:
+                modified[args[0]] = (args, kwargs)
+
+    def _send_batch_events(self, events):
+        if not any(events.values()):
+            return
+        self._sending_batch = True
+        try:
+            for event_name, node_events in events.items():
+                for args, kwargs in node_events.values():
+                    self.trigger_callbacks(event_name, *args, **kwargs)
+        finally:
+            self._sending_batch = False
+        self.trigger_callbacks(
+            DataStorage.DataStorageEvent.BATCH,
+            list(events[DataStorage.DataStorageEvent.ADD_NODE]),
+            list(events[DataStorage.DataStorageEvent.REMOVE_NODE]),
+            list(events[DataStorage.DataStorageEvent.MODIFIED_NODE]))
+
+    def is_sending_batch(self):
+        """
+        Whether the node events being sent are the merged ones of a batch,
+        listeners also handling its BATCH event may skip them.
+        """
+        return self._sending_batch
+
     def register_callback(self, callback, event_name):
         if event_name in self._callbacks:
             if callback not in self._callbacks[event_name]:
@@ -238,51 +1602,140 @@ class DataStorage:
         _parent_id = "0"
         if parent_node:
             _parent_id = parent_node.get("id")
-        node.properties.update(
+        if _id in self.nodes:
+            self._unlink_node(_id)
+        node.update(
             {
                 "parent": _parent_id,
                 **item_keys,
             }
         )
         node.parent = parent_node
+        node.data_storage = self
         self.nodes[_id] = node
-        self._update_hierarchy()
+        self.children_map[_parent_id].add(_id)
+        self._sequences[_id] = self._next_sequence
+        self._next_sequence += 1
+        self._index_node(node)
+        self.invalidate_bounds(_id)
+        # Budget the data decoded on io_manager workers here, on the loop thread
+        data_manager.enforce_budget()
         self.trigger_callbacks(DataStorage.DataStorageEvent.ADD_NODE,
                                node, parent_node, **item_keys)
         return _id
 
     def remove_node(self, _id):
-        for id in self.data_storage.children_map[_id]:
+        if _id not in self.nodes:
+            return
+        for id in list(self.children_map.get(_id, ())):
             self.remove_node(id)
-        self.data_storage.nodes.pop(_id)
-        self.data_storage._update_hierarchy()
+        self._unlink_node(_id)
         self.trigger_callbacks(DataStorage.DataStorageEvent.REMOVE_NODE, _id)
 
+    def _unlink_node(self, _id):
+        node = self.nodes.pop(_id)
+        self._unindex_node(node)
+        self._discard_bounds(_id)
+        node.data_storage = None
+        del self._sequences[_id]
+        children = self.children_map.get(node.get("parent", "0"))
+        if children is not None:
+            children.discard(_id)
+        if not self.children_map.get(_id, True):
+            del self.children_map[_id]
+
+    def _index_node(self, node: DataNode):
+        _id = node.get("id")
+        name = node.get("name")
+        data_type = node.data.type if node.data is not None else DataType.Undefined
+        layer_key = (_layer_value(node.get("layer")), _layer_value(node.get("view_layer")),
+                     -self._sequences[_id], _id)
+        self._index_keys[_id] = (name, data_type, layer_key)
+        self._name_index[name][_id] = node
+        self._type_index[data_type][_id] = node
+        insort(self._layer_index[DataType.Undefined], layer_key)
+        if data_type != DataType.Undefined:
+            insort(self._layer_index[data_type], layer_key)
+
+    def _unindex_node(self, node: DataNode):
+        _id = node.get("id")
+        name, data_type, layer_key = self._index_keys.pop(_id)
+        for index, key in ((self._name_index, name), (self._type_index, data_type)):
+            del index[key][_id]
+            if not index[key]:
+                del index[key]
+        for key in {DataType.Undefined, data_type}:
+            layers = self._layer_index[key]
+            del layers[bisect_left(layers, layer_key)]
+
     def modefied(self, _id):
+        self.invalidate_bounds(_id)
         self.trigger_callbacks(DataStorage.DataStorageEvent.MODIFIED_NODE, _id)
 
     def get_node(self, _id):
         return self.nodes.get(f"{_id}")
 
     def get_named_node(self, name: str):
-        for node in self.nodes.values():
-            if node.get("name") == name:
-                return node
+        nodes = self._name_index.get(name)
+        if nodes:
+            return next(iter(nodes.values()))
+
+    def get_named_nodes(self, name: str):
+        return list(self._name_index.get(name, {}).values())
+
+    def get_nodes(self, data_type: DataType):
+        return list(self._type_index.get(data_type, {}).values())
+
+    def get_children(self, _id):
+        return [self.nodes[x] for x in self.children_map.get(_id, ())]
 
     def _update_hierarchy(self):
+        """
+        Rebuild children_map from scratch, it is maintained by add_node and remove_node.
+        """
         self.children_map.clear()
         for node in self.nodes.values():
-            _parent_id = "0"
-            if node.parent:
-                _parent_id = node.parent.id
-            self.children_map[_parent_id].add(node.get("id"))
+            self.children_map[node.get("parent", "0")].add(node.get("id"))
+
+    def invalidate_bounds(self, _id=None):
+        """
+        Drop the cached bounds of the node, of every node if _id is not a node id.
+        """
+        node = self.nodes.get(_id)
+        if node is None:
+            self._node_bounds.clear()
+            self._bounds = None
+            self._dirty_bounds = set(x for x, node in self.nodes.items()
+                                     if node.get("visible") and node.data is not None)
+            return
+        self._discard_bounds(_id)
+        if node.get("visible") and node.data is not None:
+            self._dirty_bounds.add(_id)
+
+    def _discard_bounds(self, _id):
+        self._dirty_bounds.discard(_id)
+        bounds = self._node_bounds.pop(_id, None)
+        # The union only shrinks if the node was on its boundary
+        if bounds is not None and self._bounds is not None and \
+                any(bounds[i] == self._bounds[i] for i in range(6)):
+            self._bounds = None
 
     def get_bounds(self):
-        bounds_list = []
-        for node in self.nodes.values():
-            if node.get("visible"):
-                bounds_list.append(node.get_data().get_bounds())
-        return bounds_union(*bounds_list)
+        added = []
+        for _id in list(self._dirty_bounds):
+            bounds = self.nodes[_id].get_data().get_bounds()
+            if bounds is None:
+                # Lazy data not loaded yet, asked again on the next call
+                continue
+            bounds = tuple(bounds)
+            self._dirty_bounds.discard(_id)
+            self._node_bounds[_id] = bounds
+            added.append(bounds)
+        if self._bounds is None:
+            self._bounds = bounds_union(*self._node_bounds.values())
+        elif added:
+            self._bounds = bounds_union(self._bounds, *added)
+        return self._bounds
 
     def get_center(self):
         bounds = self.get_bounds()
@@ -292,36 +1745,167 @@ class DataStorage:
         center[2] = (bounds[4]+bounds[5])*0.5
         return center
 
+    def _get_export_tasks(self, directory, node_ids, compression):
+        """
+        Nodes to export as (source, filename, compression). Loaded data is
+        shallow copied here, so data replaced on the nodes meanwhile, e.g. by
+        set_image or from_array, is not written, but the arrays are shared:
+        in-place writes, e.g. through as_array, before the export finishes
+        race the writer. Lazy data never loaded is read from its file by the
+        worker, which leaves the node alone.
+        """
+        if compression not in COMPRESSION_TYPES:
+            raise ValueError(f"Unsupported compression type:{compression}")
+        os.makedirs(directory, exist_ok=True)
+        tasks = []
+        used_names = set()
+        for _id in node_ids or list(self.nodes.keys()):
+            data = self.nodes[_id].get_data()
+            if data is None:
+                continue
+            suffixes = [""]
+            if data.type == DataType.TimeSeries:
+                # One file per frame, the frames share the buffer of the data
+                ext = ".vti"
+                steps = range(data.get_number_of_time_steps())
+                sources = [data.get_frame(t) for t in steps]
+                suffixes = [f"_t{t:03d}" for t in steps]
+            elif data.type in (DataType.Image, DataType.LabelMap):
+                ext = ".vti"
+                if isinstance(data, LazyImageData) and not data.is_loaded() \
+                        and data._spill is None:
+                    source = functools.partial(load_image, data.filename,
+                                               data._use_mmap, data._use_cache)
+                else:
+                    source = vtkImageData()
+                    source.ShallowCopy(data.get_image())
+            elif data.type == DataType.Surface:
+                ext = ".vtp"
+                if isinstance(data, LazySurfaceData) and not data.is_loaded() \
+                        and data._spill is None:
+                    source = functools.partial(load_surface, data.filename, data._use_cache)
+                else:
+                    source = vtkPolyData()
+                    source.ShallowCopy(data.get_polydata())
+            elif data.type == DataType.PointSet:
+                ext = ".vtp"
+                source = vtkPolyData()
+                source.DeepCopy(data.get_polydata())
+            else:
+                continue
+            if data.type != DataType.TimeSeries:
+                sources = [source]
+            name = "".join(c if c.isalnum() or c in "-_." else "_"
+                           for c in self.nodes[_id].get("name", "")) or _id
+            filename = name
+            i = 1
+            while filename in used_names:
+                filename = f"{name}_{i}"
+                i += 1
+            used_names.add(filename)
+            for source, suffix in zip(sources, suffixes):
+                tasks.append((source, os.path.join(directory, filename + suffix + ext),
+                              compression))
+        return tasks
+
+    def export(self, directory, node_ids=None, compression="zlib", progress_callback=None):
+        """
+        Write every node, or the nodes of node_ids, to the directory through
+        the io_manager pool. Images are saved as .vti, time series as one .vti
+        per frame, surfaces and point sets as .vtp, with the arrays compressed by one of COMPRESSION_TYPES.
+        progress_callback(done, total) is called as each file is written.
+        Return the written filenames, None for the failed ones.
+        """
+        tasks = self._get_export_tasks(directory, node_ids, compression)
+        futures = {io_manager.submit(_export_task, task): i
+                   for i, task in enumerate(tasks)}
+        filenames = [None] * len(tasks)
+        for done, future in enumerate(as_completed(futures), 1):
+            try:
+                filenames[futures[future]] = future.result()
+            except Exception as e:
+                print(f"Failed to export {tasks[futures[future]][1]}: {e}")
+            if progress_callback:
+                progress_callback(done, len(tasks))
+        return filenames
+
+    async def export_async(self, directory, node_ids=None, compression="zlib",
+                           progress_callback=None):
+        """
+        Same as export without blocking the event loop, progress_callback
+        is called on the event loop thread.
+        """
+        tasks = self._get_export_tasks(directory, node_ids, compression)
+        return await io_manager.map_async(_export_task, tasks,
+                                          progress_callback=progress_callback)
+
     def get_top_node(self, data_type: DataType = DataType.Undefined) -> DataNode:
-        if data_type != DataType.Undefined:
-            alt_nodes = [x for x in self.nodes.values()
-                         if x.data.type == data_type]
-        if len(alt_nodes) == 0:
+        """
+        Node with the highest layer then view_layer, the first added on ties.
+        Any data type if data_type is Undefined.
+        """
+        layers = self._layer_index.get(data_type)
+        if not layers:
             return None
-        sort_nodes = sorted(alt_nodes,
-                            key=lambda x: x["layer"], reverse=True)
-        top_nodes = []
-        top_layer = sort_nodes[0]["layer"]
-        for node in sort_nodes:
-            if node["layer"] == top_layer:
-                top_nodes.append(node)
-            else:
-                break
-        sort_nodes = sorted(
-            top_nodes, key=lambda x: x["view_layer"], reverse=True)
-        return sort_nodes[0]
+        return self.nodes[layers[-1][3]]
+
+
+def _export_task(task):
+    source, filename, compression = task
+    data = source() if callable(source) else source
+    if data.IsA("vtkImageData"):
+        save_image(data, filename, compression=compression)
+    else:
+        save_surface(data, filename, compression=compression)
+    return filename
 
 
-def import_image_file(filename, node_name="undefined"):
-    image_data = ImageData()
-    image_data.read_data(filename)
+def import_image_file(filename, node_name="undefined", use_mmap=False, lazy=False):
+    image_data = LazyImageData() if lazy else ImageData()
+    image_data.read_data(filename, use_mmap)
     image_node = DataNode(node_name)
     image_node.set_data(image_data)
     return image_node
 
 
-def import_surface_file(filename, node_name="undefined"):
-    surface_data = SurfaceData()
+def import_label_map_file(filename, node_name="undefined", compressed=False):
+    label_map_data = LabelMapData(compressed)
+    label_map_data.read_data(filename)
+    label_map_node = DataNode(node_name)
+    label_map_node.set_data(label_map_data)
+    return label_map_node
+
+
+def import_time_series(filenames, node_name="undefined", use_mmap=False):
+    """
+    Import the image files, one per frame in this order, as one time series node.
+    """
+    series_data = TimeSeriesImageData()
+    series_data.read_data(filenames, use_mmap)
+    series_node = DataNode(node_name)
+    series_node.set_data(series_data)
+    return series_node
+
+
+def import_dicom_series(directory, node_name=None, max_workers=None):
+    """
+    Import every DICOM series found in the directory as an image node.
+    """
+    nodes = []
+    for series_uid, headers in scan_dicom_directory(directory, max_workers).items():
+        image_data = ImageData()
+        image_data.set_image(load_dicom_series(headers, max_workers))
+        name = node_name or headers[0]["series_description"] or series_uid
+        if node_name and len(nodes):
+            name = f"{node_name}_{len(nodes)}"
+        image_node = DataNode(name)
+        image_node.set_data(image_data)
+        nodes.append(image_node)
+    return nodes
+
+
+def import_surface_file(filename, node_name="undefined", lazy=False):
+    surface_data = LazySurfaceData() if lazy else SurfaceData()
     surface_data.read_data(filename)
     surface_node = DataNode(node_name)
     surface_node.set_data(surface_data)
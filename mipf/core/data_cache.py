@@ -0,0 +1,212 @@
+import hashlib
+import os
+import threading
+
+from vtkmodules.vtkIOXML import (
+    vtkXMLPolyDataReader,
+    vtkXMLPolyDataWriter
+)
+
+
+def get_data_files(filename: str):
+    """
+    Files holding the voxels of a detached header (.mhd, .nhdr), none for
+    other files. None when they are given by a pattern the cache does not
+    resolve.
+    """
+    name = filename.lower()
+    if name.endswith(".mhd"):
+        separator, keys = "=", ("elementdatafile",)
+    elif name.endswith(".nhdr"):
+        separator, keys = ":", ("data file", "datafile")
+    else:
+        return []
+    with open(filename, "rb") as f:
+        lines = [line.decode("latin-1").strip() for line in f]
+    for i, line in enumerate(lines):
+        key, _, value = line.partition(separator)
+        if key.strip().lower() not in keys:
+            continue
+        value = value.strip()
+        if value == "LOCAL":
+            return []
+        if value.startswith("LIST"):
+            names = [line for line in lines[i + 1:] if line]
+        elif "%" in value or " " in value:
+            return None
+        else:
+            names = [value]
+        return [os.path.join(os.path.dirname(filename), name) for name in names]
+    return []
+
+
+class DataCache:
+    """
+    Content addressed on-disk cache of decoded images and surfaces.
+    Images are kept as uncompressed .mha files and memory mapped on a hit,
+    surfaces as .vtp files with raw appended data. Entries are keyed by a hash
+    of the file content, size and mtime, the least recently used entries are
+    evicted once the cache grows over max_bytes.
+    The cache is disabled until a directory is set.
+    """
+    SAMPLE_SIZE = 1 << 20
+
+    def __init__(self):
+        self.directory = None
+        self.max_bytes = 0
+        self._lock = threading.Lock()
+
+    def set_directory(self, directory, max_bytes=16 * (1 << 30)):
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.max_bytes = max_bytes
+
+    def enabled(self):
+        return self.directory is not None
+
+    def get_key(self, filename: str) -> str:
+        """
+        Hash of size, mtime and the first and last MiB of the file and of the
+        data files of a detached header, reading the whole file would cost as
+        much as decoding it. None if the data files are not known, such
+        files are not cached.
+        """
+        data_files = get_data_files(filename)
+        if data_files is None:
+            return None
+        digest = hashlib.blake2b(digest_size=20)
+        for path in [filename] + data_files:
+            stat = os.stat(path)
+            digest.update(f"{stat.st_size}:{stat.st_mtime_ns}".encode())
+            with open(path, "rb") as f:
+                digest.update(f.read(DataCache.SAMPLE_SIZE))
+                if stat.st_size > 2 * DataCache.SAMPLE_SIZE:
+                    f.seek(-DataCache.SAMPLE_SIZE, os.SEEK_END)
+                    digest.update(f.read(DataCache.SAMPLE_SIZE))
+        return digest.hexdigest()
+
+    def get_path(self, key: str, suffix: str) -> str:
+        return os.path.join(self.directory, key + suffix)
+
+    def _lookup(self, filename, suffix):
+        if not self.enabled():
+            return None, None
+        key = self.get_key(filename)
+        if key is None:
+            return None, None
+        path = self.get_path(key, suffix)
+        if os.path.exists(path):
+            # Access time for the LRU eviction, atime is often disabled.
+            os.utime(path)
+            return key, path
+        return key, None
+
+    def get_image(self, filename: str):
+        from mipf.core.utils import load_meta_image_mmap
+        _, path = self._lookup(filename, ".mha")
+        if path:
+            return load_meta_image_mmap(path)
+        return None
+
+    def put_image(self, filename: str, image):
+        if not self.enabled():
+            return
+        key = self.get_key(filename)
+        if key is None:
+            return
+        from mipf.core.utils import save_meta_image_raw
+        path = self.get_path(key, ".mha")
+        # Written here as vtkMetaImageWriter drops the direction and the scalar name
+        self._write(lambda tmp_path: save_meta_image_raw(image, tmp_path), path)
+
+    def get_surface(self, filename: str):
+        _, path = self._lookup(filename, ".vtp")
+        if path:
+            reader = vtkXMLPolyDataReader()
+            reader.SetFileName(path)
+            reader.Update()
+            return reader.GetOutput()
+        return None
+
+    def put_surface(self, filename: str, polydata):
+        if not self.enabled():
+            return
+        key = self.get_key(filename)
+        if key is None:
+            return
+        path = self.get_path(key, ".vtp")
+        writer = vtkXMLPolyDataWriter()
+        writer.SetDataModeToAppended()
+        writer.EncodeAppendedDataOff()
+        writer.SetCompressorTypeToNone()
+        writer.SetInputData(polydata)
+
+        def write(tmp_path):
+            writer.SetFileName(tmp_path)
+            writer.Write()
+            if writer.GetErrorCode() != 0:
+                raise IOError(f"Failed to write {tmp_path}")
+        self._write(write, path)
+
+    def _write(self, write, path):
+        """
+        write(filename) the entry aside and rename it so that readers never
+        see a partial entry, nothing is cached if it raises.
+        """
+        root, ext = os.path.splitext(path)
+        tmp_path = f"{root}.{os.getpid()}.{threading.get_ident()}.tmp{ext}"
+        try:
+            write(tmp_path)
+            os.replace(tmp_path, path)
+        except (IOError, OSError, ValueError) as e:
+            print(f"Failed to cache {path}: {e}")
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        self.evict()
+
+    def get_size(self):
+        return sum(x[2] for x in self._entries())
+
+    def _entries(self):
+        entries = []
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, path, stat.st_size))
+        return entries
+
+    def evict(self):
+        """
+        Remove the least recently used entries until the cache fits in max_bytes.
+        """
+        if not self.enabled():
+            return
+        with self._lock:
+            entries = sorted(self._entries())
+            total = sum(x[2] for x in entries)
+            for _, path, size in entries:
+                if total <= self.max_bytes:
+                    break
+                try:
+                    os.remove(path)
+                    total -= size
+                except OSError:
+                    # Still opened or mapped on some platforms.
+                    pass
+
+    def clear(self):
+        if not self.enabled():
+            return
+        with self._lock:
+            for _, path, _ in self._entries():
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+
+data_cache = DataCache()
@@ -1,19 +1,112 @@
+import tempfile
+import threading
+from collections import OrderedDict
+
+
 class DataManager:
     """
     Data manager.
+    With a memory budget, the least recently used data of the unpinned nodes
+    is spilled to scratch files once the data in memory exceeds it, the data
+    reads itself back on its next access. Nodes are pinned while visible or
+    active.
+    add_data may be called from io_manager workers and only records the data,
+    the budget is enforced, and the eviction callbacks called, by
+    enforce_budget on the event loop thread, e.g. when a node is added to a
+    data storage.
     """
 
     def __init__(self):
-        self.dataset = {}
+        self.dataset = OrderedDict()
+        self.max_bytes = None
+        self.scratch_directory = None
+        self._pinned = set()
+        self._eviction_callbacks = []
+        # Guards dataset and _pinned, shared with the io_manager workers
+        self._lock = threading.RLock()
+
+    def set_memory_budget(self, max_bytes, scratch_directory=None):
+        """
+        Budget in bytes, None to keep everything in memory. The scratch files
+        go to a new temporary directory if scratch_directory is None.
+        """
+        self.max_bytes = max_bytes
+        if scratch_directory:
+            self.scratch_directory = scratch_directory
+        self.enforce_budget()
+
+    def get_scratch_directory(self):
+        if self.scratch_directory is None:
+            self.scratch_directory = tempfile.mkdtemp(prefix="mipf_spill_")
+        return self.scratch_directory
+
+    def register_eviction_callback(self, callback):
+        """
+        callback(uid) is called after the data of uid was spilled, the holders
+        of references to its vtk objects should drop them.
+        """
+        if callback not in self._eviction_callbacks:
+            self._eviction_callbacks.append(callback)
+
+    def set_pinned(self, uid, pinned):
+        with self._lock:
+            if pinned:
+                self._pinned.add(uid)
+                return
+            if uid not in self._pinned:
+                return
+            self._pinned.discard(uid)
+        self.enforce_budget()
 
     def add_data(self, data, uid):
-        self.dataset[uid] = data
+        with self._lock:
+            old = self.dataset.get(uid)
+            if old is not None and old is not data:
+                old.discard_spill()
+            self.dataset[uid] = data
+            self.dataset.move_to_end(uid)
 
     def remove_data(self, uid):
-        self.dataset.pop(uid)
-        
+        with self._lock:
+            data = self.dataset.pop(uid, None)
+            self._pinned.discard(uid)
+        if data is not None:
+            data.discard_spill()
+
     def get_data(self, uid):
-        return self.dataset.get(uid)
+        with self._lock:
+            data = self.dataset.get(uid)
+            if data is not None:
+                self.dataset.move_to_end(uid)
+            return data
+
+    def get_memory_size(self):
+        with self._lock:
+            dataset = list(self.dataset.values())
+        return sum(data.get_memory_size() for data in dataset)
+
+    def enforce_budget(self):
+        """
+        Spill the least recently used unpinned data until the budget is met.
+        Call it on the event loop thread, the eviction callbacks touch the
+        rendering pipelines.
+        """
+        if self.max_bytes is None:
+            return
+        with self._lock:
+            sizes = [(uid, data, data.get_memory_size()) for uid, data in self.dataset.items()]
+        total = sum(size for _, _, size in sizes)
+        for uid, data, size in sizes:
+            if total <= self.max_bytes:
+                break
+            with self._lock:
+                if size == 0 or uid in self._pinned or self.dataset.get(uid) is not data:
+                    continue
+                freed = data.release(self.get_scratch_directory())
+            if freed:
+                total -= freed
+                for callback in self._eviction_callbacks:
+                    callback(uid)
 
 
 data_manager = DataManager()
@@ -0,0 +1,133 @@
+import os
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List
+
+import numpy as np
+from vtkmodules.vtkCommonDataModel import vtkImageData
+from vtkmodules.util.numpy_support import numpy_to_vtk
+
+
+def _import_pydicom():
+    try:
+        import pydicom
+    except ImportError:
+        raise ImportError(
+            "pydicom is required for reading DICOM series, install it with 'pip install pydicom'")
+    return pydicom
+
+
+def read_dicom_header(filename: str):
+    """
+    Read the geometry tags of one DICOM file, None if it is not a DICOM image.
+    """
+    pydicom = _import_pydicom()
+    try:
+        ds = pydicom.dcmread(filename, stop_before_pixels=True)
+    except Exception:
+        return None
+    if "SeriesInstanceUID" not in ds or "Rows" not in ds:
+        return None
+    return {
+        "filename": filename,
+        "series_uid": str(ds.SeriesInstanceUID),
+        "series_description": str(ds.get("SeriesDescription", "")),
+        "rows": int(ds.Rows),
+        "columns": int(ds.Columns),
+        "position": [float(x) for x in ds.get("ImagePositionPatient", [0, 0, 0])],
+        "orientation": [float(x) for x in ds.get("ImageOrientationPatient", [1, 0, 0, 0, 1, 0])],
+        "pixel_spacing": [float(x) for x in ds.get("PixelSpacing", [1, 1])],
+        "slice_thickness": float(ds.get("SliceThickness", 1) or 1),
+        "instance_number": int(ds.get("InstanceNumber", 0) or 0),
+    }
+
+
+def read_dicom_pixels(filename: str):
+    """
+    Decode the pixels of one DICOM file, return (pixels, slope, intercept).
+    """
+    pydicom = _import_pydicom()
+    ds = pydicom.dcmread(filename)
+    slope = float(ds.get("RescaleSlope", 1) or 1)
+    intercept = float(ds.get("RescaleIntercept", 0) or 0)
+    return ds.pixel_array, slope, intercept
+
+
+def _map(fn, items, max_workers=None):
+    if max_workers == 1 or len(items) < 2:
+        return [fn(item) for item in items]
+    chunksize = max(1, len(items) // ((max_workers or os.cpu_count() or 1) * 4))
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        return list(executor.map(fn, items, chunksize=chunksize))
+
+
+def scan_dicom_directory(directory: str, max_workers=None) -> Dict[str, List[dict]]:
+    """
+    Scan a directory recursively and group the DICOM slices by series instance uid.
+    The slices of every series are sorted along the slice normal.
+    """
+    filenames = []
+    for root, _, files in os.walk(directory):
+        for name in files:
+            filenames.append(os.path.join(root, name))
+
+    series = defaultdict(list)
+    for header in _map(read_dicom_header, filenames, max_workers):
+        if header:
+            series[header["series_uid"]].append(header)
+
+    for headers in series.values():
+        normal = _slice_normal(headers[0]["orientation"])
+        headers.sort(key=lambda x: (np.dot(normal, x["position"]), x["instance_number"]))
+    return dict(series)
+
+
+def _slice_normal(orientation):
+    return np.cross(orientation[:3], orientation[3:6])
+
+
+def load_dicom_series(headers: List[dict], max_workers=None) -> vtkImageData:
+    """
+    Decode the sorted slices of one series across a process pool and assemble them
+    into one vtkImageData with spacing, origin and direction taken from the headers.
+    """
+    first = headers[0]
+    rows, columns = first["rows"], first["columns"]
+    headers = [x for x in headers if x["rows"] == rows and x["columns"] == columns]
+
+    slices = _map(read_dicom_pixels, [x["filename"] for x in headers], max_workers)
+    rescaled = any(slope != 1 or intercept != int(intercept)
+                   for _, slope, intercept in slices)
+    if rescaled:
+        dtype = np.float32
+    else:
+        dtype = np.result_type(slices[0][0].dtype, np.int16)
+
+    volume = np.empty((len(slices), rows, columns), dtype=dtype)
+    for i, (pixels, slope, intercept) in enumerate(slices):
+        if rescaled:
+            volume[i] = pixels * slope + intercept
+        else:
+            volume[i] = pixels
+            if intercept:
+                volume[i] += int(intercept)
+
+    orientation = first["orientation"]
+    normal = _slice_normal(orientation)
+    if len(headers) > 1:
+        distances = np.array([np.dot(normal, x["position"]) for x in headers])
+        slice_spacing = float(np.median(np.diff(distances))) or first["slice_thickness"]
+    else:
+        slice_spacing = first["slice_thickness"]
+
+    image = vtkImageData()
+    image.SetDimensions(columns, rows, len(slices))
+    image.SetSpacing(first["pixel_spacing"][1], first["pixel_spacing"][0], slice_spacing)
+    image.SetOrigin(first["position"])
+    image.SetDirectionMatrix(orientation[0], orientation[3], normal[0],
+                             orientation[1], orientation[4], normal[1],
+                             orientation[2], orientation[5], normal[2])
+    scalars = numpy_to_vtk(volume.ravel(), deep=0)
+    scalars.SetName("DICOMImage")
+    image.GetPointData().SetScalars(scalars)
+    return image
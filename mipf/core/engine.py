@@ -37,7 +37,7 @@ def initialize_internal_binding(server, data_storage, **kwargs):
     @state.change("image_level_window")
     def update_image_level_window(image_level_window, **kwargs):
         for node in data_storage.nodes.values():
-            if node.data.type == DataType.Image and node.get("activate"):
+            if node.data.type in IMAGE_DATA_TYPES and node.get("activate"):
                 scalar_opacity = []
                 scalar_opacity.append((image_level_window[0], 0.0))
                 scalar_opacity.append((image_level_window[0]+50, 0.2))
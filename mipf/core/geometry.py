@@ -1,15 +1,81 @@
+import numpy as np
+
+
 class Geometry:
+    """
+    Geometry of a voxel grid, index to world is
+    world = origin + direction * (spacing * index).
+    The index to world matrix and its inverse are cached, the transforms
+    take a single position or an (N, 3) array of them.
+    """
+
     def __init__(self):
         self.origin = [0, 0, 0]
         self.spacing = [1, 1, 1]
+        self.direction = [1, 0, 0, 0, 1, 0, 0, 0, 1]
+        self.dimensions = [0, 0, 0]
         self.matrix = [1, 0, 0, 0, 0, 1, 0, 0, 0, 0, 1, 0, 0, 0, 0, 1]
         self.bounds = [0, 0, 0, 0, 0, 0]
+        self._matrix = np.identity(4)
+        self._inverse = None
+
+    def set_image(self, image):
+        """
+        Fill from a vtkImageData, index 0 being the first voxel of its extent.
+        """
+        direction = image.GetDirectionMatrix()
+        extent = image.GetExtent()
+        spacing = image.GetSpacing()
+        origin = np.array(image.GetOrigin()) + \
+            np.array([[direction.GetElement(i, j) for j in range(3)] for i in range(3)]) @ \
+            (np.array(extent[::2]) * np.array(spacing))
+        self.set_grid(image.GetDimensions(), spacing, origin.tolist(),
+                      [direction.GetElement(i, j) for i in range(3) for j in range(3)])
+        self.bounds = list(image.GetBounds())
+
+    def set_grid(self, dimensions, spacing, origin, direction=None):
+        self.dimensions = list(dimensions)
+        self.spacing = list(spacing)
+        self.origin = list(origin)
+        if direction is not None:
+            self.direction = list(direction)
+        matrix = np.identity(4)
+        matrix[:3, :3] = np.reshape(self.direction, (3, 3)) * self.spacing
+        matrix[:3, 3] = self.origin
+        self._matrix = matrix
+        self._inverse = None
+        self.matrix = matrix.ravel().tolist()
+        corners = self.index_to_world(
+            np.array([[i, j, k] for i in (0, 1) for j in (0, 1) for k in (0, 1)]) *
+            (np.maximum(self.dimensions, 1) - 1))
+        minimum, maximum = corners.min(axis=0).tolist(), corners.max(axis=0).tolist()
+        self.bounds = [minimum[0], maximum[0], minimum[1], maximum[1], minimum[2], maximum[2]]
+
+    def get_inverse(self) -> np.ndarray:
+        if self._inverse is None:
+            self._inverse = np.linalg.inv(self._matrix)
+        return self._inverse
 
     def index_to_world(self, index):
-        pass
+        index = np.asarray(index, dtype=np.float64)
+        return index @ self._matrix[:3, :3].T + self._matrix[:3, 3]
+
+    def world_to_index(self, pos, rounded=False):
+        """
+        Continuous index of the positions, the nearest voxel index if rounded.
+        """
+        inverse = self.get_inverse()
+        index = np.asarray(pos, dtype=np.float64) @ inverse[:3, :3].T + inverse[:3, 3]
+        if rounded:
+            return np.rint(index).astype(np.int64)
+        return index
 
-    def world_to_index(self, pos):
-        pass
+    def is_inside(self, index):
+        """
+        Whether the voxel indices are in the grid.
+        """
+        index = np.asarray(index)
+        return np.all((index >= 0) & (index < np.asarray(self.dimensions)), axis=-1)
 
     def get_matrix(self):
         return self.matrix
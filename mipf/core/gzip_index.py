@@ -0,0 +1,141 @@
+import bisect
+import os
+import threading
+import zlib
+from collections import OrderedDict
+
+from mipf.core.data_cache import data_cache
+from mipf.core.io_manager import io_manager
+
+
+class GzipIndex:
+    """
+    Random access reader of a gzip file through seek points.
+    With the optional indexed_gzip package the index is built by it and
+    persisted next to the data cache entries. Otherwise seek points are copies
+    of the zlib inflate state taken every span uncompressed bytes while the
+    file is read forward, they are kept in memory for the process lifetime.
+    """
+    CHUNK_SIZE = 1 << 16
+
+    def __init__(self, filename: str, span: int = 1 << 22):
+        self.filename = filename
+        self.span = span
+        self._lock = threading.Lock()
+        self._file = None
+        self._igzip = None
+        self._index_path = None
+        # (uncompressed offset, compressed offset, inflate state)
+        self._offsets = [0]
+        self._points = [(0, 0, zlib.decompressobj(31))]
+        self._complete = False
+        self._future = None
+
+        try:
+            import indexed_gzip
+        except ImportError:
+            self._file = open(filename, "rb")
+            return
+        self._igzip = indexed_gzip.IndexedGzipFile(filename, spacing=span)
+        if data_cache.enabled():
+            self._index_path = data_cache.get_path(
+                data_cache.get_key(filename), ".gzidx")
+            if os.path.exists(self._index_path):
+                self._igzip.import_index(self._index_path)
+                self._complete = True
+
+    def is_complete(self):
+        return self._complete
+
+    def build(self):
+        """
+        Inflate the whole file once to create all the seek points.
+        """
+        with self._lock:
+            if self._complete:
+                return
+            if self._igzip:
+                self._igzip.build_full_index()
+                if self._index_path:
+                    self._igzip.export_index(self._index_path)
+            else:
+                self._inflate(self._offsets[-1], float("inf"), None)
+            self._complete = True
+
+    def build_async(self, callback=None):
+        """
+        build on the io_manager pool, once, return the future.
+        callback() is called on the event loop thread once built.
+        """
+        if self._future is None:
+            self._future = io_manager.submit(self.build)
+        if callback:
+            io_manager.call_on_loop_when_done(self._future, callback)
+        return self._future
+
+    def read(self, offset: int, size: int) -> bytes:
+        """
+        Read size uncompressed bytes from offset, inflating only from the
+        closest seek point before it.
+        """
+        with self._lock:
+            if self._igzip:
+                self._igzip.seek(offset)
+                return self._igzip.read(size)
+            out = bytearray()
+            self._inflate(offset, offset + size, out)
+            return bytes(out)
+
+    def _inflate(self, start, end, out):
+        i = bisect.bisect_right(self._offsets, start) - 1
+        position, compressed_position, state = self._points[i]
+        inflater = state.copy()
+        self._file.seek(compressed_position)
+        pending = b""
+        while position < end and not inflater.eof:
+            if not pending:
+                pending = self._file.read(GzipIndex.CHUNK_SIZE)
+                if not pending:
+                    break
+                compressed_position += len(pending)
+            data = inflater.decompress(pending, GzipIndex.CHUNK_SIZE * 16)
+            pending = inflater.unconsumed_tail
+            if out is not None and position + len(data) > start:
+                out += data[max(0, start - position):end - position]
+            position += len(data)
+            if not inflater.eof and position >= self._offsets[-1] + self.span:
+                self._offsets.append(position)
+                self._points.append(
+                    (position, compressed_position - len(pending), inflater.copy()))
+        if inflater.eof:
+            self._complete = True
+
+    def close(self):
+        if self._igzip:
+            self._igzip.close()
+        if self._file:
+            self._file.close()
+
+
+MAX_OPENED_INDICES = 16
+_gzip_indices = OrderedDict()
+_gzip_indices_lock = threading.Lock()
+
+
+def get_gzip_index(filename: str) -> GzipIndex:
+    """
+    Shared index of the file, rebuilt only when the file changed.
+    The least recently used indices are closed past MAX_OPENED_INDICES.
+    """
+    stat = os.stat(filename)
+    key = (os.path.abspath(filename), stat.st_size, stat.st_mtime_ns)
+    with _gzip_indices_lock:
+        index = _gzip_indices.get(key)
+        if index is None:
+            index = GzipIndex(filename)
+            _gzip_indices[key] = index
+        _gzip_indices.move_to_end(key)
+        while len(_gzip_indices) > MAX_OPENED_INDICES:
+            _, stale = _gzip_indices.popitem(last=False)
+            stale.close()
+        return index
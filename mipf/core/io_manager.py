@@ -0,0 +1,99 @@
+import asyncio
+import functools
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+
+_worker_state = threading.local()
+
+
+def _mark_worker():
+    _worker_state.is_worker = True
+
+
+class IOManager:
+    """
+    IO manager, runs file decoding on a worker pool instead of the event loop thread.
+    """
+
+    def __init__(self, max_workers=None):
+        self.max_workers = max_workers or min(8, os.cpu_count() or 1)
+        self._executor = None
+
+    def set_max_workers(self, max_workers):
+        self.shutdown()
+        self.max_workers = max_workers
+
+    def get_executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.max_workers,
+                                                thread_name_prefix="mipf_io",
+                                                initializer=_mark_worker)
+        return self._executor
+
+    def in_worker(self):
+        """
+        Whether the calling thread is one of the pool, where waiting on other
+        submitted tasks can deadlock a saturated pool.
+        """
+        return getattr(_worker_state, "is_worker", False)
+
+    def submit(self, fn, *args, **kwargs):
+        return self.get_executor().submit(fn, *args, **kwargs)
+
+    def call_on_loop_when_done(self, future, callback):
+        """
+        Call callback() on the running event loop thread once the future is done.
+        Nothing is called when no event loop is running in this thread.
+        """
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        future.add_done_callback(
+            lambda _: loop.call_soon_threadsafe(callback))
+
+    async def run_async(self, fn, *args, **kwargs):
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(self.get_executor(),
+                                          functools.partial(fn, *args, **kwargs))
+
+    async def map_async(self, fn, items, result_callback=None, progress_callback=None):
+        """
+        Run fn on every item in parallel.
+        result_callback(index, result) and progress_callback(done, total) are
+        called on the event loop thread as each item finishes.
+        Items raising an exception give a None result.
+        """
+        items = list(items)
+        loop = asyncio.get_event_loop()
+        futures = [loop.run_in_executor(self.get_executor(), fn, item)
+                   for item in items]
+        indices = {future: index for index, future in enumerate(futures)}
+        results = [None] * len(futures)
+        pending = set(futures)
+        done = 0
+        while pending:
+            finished, pending = await asyncio.wait(
+                pending, return_when=asyncio.FIRST_COMPLETED)
+            for future in finished:
+                index = indices[future]
+                try:
+                    results[index] = future.result()
+                except Exception as e:
+                    print(f"Failed to process {items[index]}: {e}")
+                done += 1
+                if result_callback:
+                    result_callback(index, results[index])
+                if progress_callback:
+                    progress_callback(done, len(futures))
+        return results
+
+    def shutdown(self, wait=True):
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait)
+            self._executor = None
+
+
+io_manager = IOManager()
@@ -1,6 +1,8 @@
 from abc import ABC, abstractmethod
 from mipf.core.data import *
 from mipf.core.local_storage import *
+from mipf.core.render_window_manager import render_window_manager
+from mipf.core.slice_cache import get_aligned_axes, extract_aligned_slice
 from vtkmodules.vtkRenderingCore import (
     vtkPolyDataMapper,
     vtkActor,
@@ -9,8 +11,10 @@ from vtkmodules.vtkRenderingCore import (
     vtkVolume,
     vtkPropAssembly,
     vtkImageActor,
-    vtkProperty
+    vtkProperty,
+    vtkGlyph3DMapper
 )
+from vtkmodules.vtkCommonCore import vtkLookupTable
 from vtkmodules.vtkCommonMath import (
     vtkMatrix4x4,
 )
@@ -90,6 +94,24 @@ def update_representation(actor, mode):
         property.EdgeVisibilityOn()
 
 
+def _get_render_level(node, interacting):
+    """
+    Pyramid level to render, "interactive_level" while the user interacts.
+    """
+    if interacting:
+        return node.get("interactive_level", 1)
+    return 0
+
+
+def _get_render_image(node, data, interacting):
+    """
+    Image to render, showing the "time_step" frame of time series.
+    """
+    if data.type == DataType.TimeSeries:
+        data.set_time_step(node.get("time_step", 0))
+    return data.get_image(_get_render_level(node, interacting))
+
+
 class MapperBase(ABC):
     def __init__(self):
         self.node = None
@@ -109,8 +131,36 @@ class MapperBase(ABC):
     def generate_data_for_renderer(self, renderer):
         pass
 
-    def _apply_actor_properties(self, renderer):
-        if self.node and self.get_prop(renderer):
+    def set_interacting(self, interacting, renderer):
+        pass
+
+    def set_slice_cache(self, slice_cache, renderer):
+        pass
+
+    def release_inputs(self):
+        """
+        Drop the references to the node data held for rendering in every renderer.
+        """
+        for ls in self.lsh.rls.values():
+            self._release_inputs(ls)
+
+    def _release_inputs(self, ls):
+        pass
+
+    def _get_modified_properties(self, renderer):
+        """
+        Node properties modified since the last call for the renderer,
+        all of them on the first call.
+        """
+        ls = self.lsh.get_local_storage(renderer)
+        modified = self.node.get_modified_keys(ls.synced_version)
+        ls.synced_version = self.node.get_version()
+        return modified
+
+    def _apply_actor_properties(self, renderer, modified=None):
+        if modified is None:
+            modified = self._get_modified_properties(renderer)
+        if self.node and self.get_prop(renderer) and "visible" in modified:
             visbile = self.node.get("visible")
             if visbile:
                 self.get_prop(renderer).SetVisibility(visbile)
@@ -122,6 +172,7 @@ class SurfaceMapper3D(MapperBase):
             self.mapper = vtkPolyDataMapper()
             self.actor = vtkActor()
             self.actor.SetMapper(self.mapper)
+            self.synced_version = -1
 
     def __init__(self):
         MapperBase.__init__(self)
@@ -135,25 +186,31 @@ class SurfaceMapper3D(MapperBase):
         MapperBase.set_node(self, node)
         node["representation"] = Representation.Surface
 
+    def _release_inputs(self, ls):
+        ls.mapper.RemoveAllInputs()
+
     def initialize_mapper(self, renderer):
         pass
 
     def _apply_actor_properties(self, renderer):
         ls = self.lsh.get_local_storage(renderer)
-        MapperBase._apply_actor_properties(self, renderer)
-        opacity = self.node.get("opacity")
-        if opacity:
-            self.get_prop(renderer).GetProperty().SetOpacity(
-                opacity)
-
-        color = self.node.get("color")
-        if color:
-            self.get_prop(renderer).GetProperty().SetColor(
-                color[0], color[1], color[2])
-            if len(color) == 4:
-                self.get_prop(renderer).GetProperty().SetOpacity(color[3])
-
-        if "representation" in self.node.properties:
+        modified = self._get_modified_properties(renderer)
+        MapperBase._apply_actor_properties(self, renderer, modified)
+        # The alpha of the color overrides the opacity
+        if "opacity" in modified or "color" in modified:
+            opacity = self.node.get("opacity")
+            if opacity:
+                self.get_prop(renderer).GetProperty().SetOpacity(
+                    opacity)
+
+            color = self.node.get("color")
+            if color:
+                self.get_prop(renderer).GetProperty().SetColor(
+                    color[0], color[1], color[2])
+                if len(color) == 4:
+                    self.get_prop(renderer).GetProperty().SetOpacity(color[3])
+
+        if "representation" in modified and "representation" in self.node.properties:
             update_representation(
                 self.get_prop(renderer), self.node.get("representation"))
             
@@ -172,6 +229,11 @@ class SurfaceMapper3D(MapperBase):
             self.get_prop(renderer).VisibilityOn()
         data = self.node.get_data()
         if data and data.type == DataType.Surface:
+            if isinstance(data, LazySurfaceData) and not data.is_loaded():
+                # Shown once read on the io_manager pool
+                self.get_prop(renderer).VisibilityOff()
+                data.prefetch(render_window_manager.request_view_update)
+                return
             if ls.mapper.GetInput() != data.get_polydata():
                 # normals = vtkPolyDataNormals()
                 # normals.SetInputData(data.get_polydata())
@@ -205,6 +267,8 @@ class ImageMapper3D(MapperBase):
             self.volume = vtkVolume()
             self.volume.SetMapper(self.mapper)
             self.volume.SetProperty(self.volume_property)
+            self.interacting = False
+            self.synced_version = -1
 
     def __init__(self):
         MapperBase.__init__(self)
@@ -213,22 +277,48 @@ class ImageMapper3D(MapperBase):
     def get_prop(self, renderer):
         ls = self.lsh.get_local_storage(renderer)
         return ls.volume
+
+    def set_interacting(self, interacting, renderer):
+        ls = self.lsh.get_local_storage(renderer)
+        ls.interacting = interacting
     
     vtkImageData.GetDirectionMatrix
 
+    def _release_inputs(self, ls):
+        ls.mapper.RemoveAllInputs()
+
     def initialize_mapper(self, renderer):
         pass
 
     def _apply_actor_properties(self, renderer):
-        MapperBase._apply_actor_properties(self, renderer)
+        modified = self._get_modified_properties(renderer)
+        MapperBase._apply_actor_properties(self, renderer, modified)
         ls = self.lsh.get_local_storage(renderer)
-        color_function = self.node.get("color_function")
-        if color_function:
-            ls.volume_property.SetColor(color_function)
-
-        opacity_function = self.node.get("opacity_function")
-        if opacity_function:
-            ls.volume_property.SetScalarOpacity(opacity_function)
+        # The transfer functions override the points
+        if "scalar_opacity" in modified or "opacity_function" in modified:
+            scalar_opacity = self.node.get("scalar_opacity")
+            if scalar_opacity:
+                opacity_function = ls.volume_property.GetScalarOpacity()
+                opacity_function.RemoveAllPoints()
+                for scalar, opacity in scalar_opacity:
+                    opacity_function.AddPoint(scalar, opacity)
+
+            opacity_function = self.node.get("opacity_function")
+            if opacity_function:
+                ls.volume_property.SetScalarOpacity(opacity_function)
+
+        if "colors" in modified or "color_function" in modified:
+            colors = self.node.get("colors")
+            if colors:
+                color_function = vtkColorTransferFunction()
+                for color in colors:
+                    color_function.AddRGBPoint(
+                        color[0], color[1], color[2], color[3])
+                ls.volume_property.SetColor(color_function)
+
+            color_function = self.node.get("color_function")
+            if color_function:
+                ls.volume_property.SetColor(color_function)
 
     def generate_data_for_renderer(self, renderer):
         ls = self.lsh.get_local_storage(renderer)
@@ -240,36 +330,46 @@ class ImageMapper3D(MapperBase):
         else:
             self.get_prop(renderer).VisibilityOn()
 
-        scalar_opacity = self.node.get("scalar_opacity")
-        if scalar_opacity:
-            opacity_function = ls.volume_property.GetScalarOpacity()
-            opacity_function.RemoveAllPoints()
-            for scalar, opacity in scalar_opacity:
-                opacity_function.AddPoint(scalar, opacity)
-
-        colors = self.node.get("colors")
-        if colors:
-            color_function = vtkColorTransferFunction()
-            for color in colors:
-                color_function.AddRGBPoint(
-                    color[0], color[1], color[2], color[3])
-            ls.volume_property.SetColor(color_function)
-
         data = self.node.get_data()
-        if data and data.type == DataType.Image:
-            if ls.mapper.GetInput() != data.get_image():
-                ls.mapper.SetInputData(data.get_image())
+        if data and data.type in IMAGE_DATA_TYPES:
+            image = _get_render_image(self.node, data, ls.interacting)
+            if ls.mapper.GetInput() != image:
+                ls.mapper.SetInputData(image)
             self._apply_actor_properties(renderer)
 
 
 class PointSetMapper3D(MapperBase):
+    """
+    Points drawn as spheres instanced by one vtkGlyph3DMapper on the point
+    set arrays. The "radii" attribute gives the sphere radii, the node
+    "pointsize" those missing or not positive. The "colors" attribute, or the
+    node "unselectedcolor", colors them, the "selected" ones take the node
+    "selectedcolor". Moving points rebuilds no geometry, the glyph arrays
+    are derived again only when their sources change.
+    """
     class LocalStorage:
         def __init__(self):
             self.assembly = vtkPropAssembly()
-            self.mapper = vtkPolyDataMapper()
+            self.sphere = vtkSphereSource()
+            self.sphere.SetRadius(1.0)
+            self.sphere.SetThetaResolution(16)
+            self.sphere.SetPhiResolution(12)
+            self.input = vtkPolyData()
+            self.mapper = vtkGlyph3DMapper()
+            self.mapper.SetInputData(self.input)
+            self.mapper.SetSourceConnection(self.sphere.GetOutputPort())
+            self.mapper.OrientOff()
+            self.mapper.ScalingOn()
+            self.mapper.SetScaleModeToScaleByMagnitude()
+            self.mapper.SetScaleArray("glyph_radii")
+            self.mapper.SetScalarModeToUsePointFieldData()
+            self.mapper.SelectColorArray("glyph_colors")
+            self.mapper.SetColorModeToDirectScalars()
             self.actor = vtkActor()
             self.actor.SetMapper(self.mapper)
             self.assembly.AddPart(self.actor)
+            self.glyph_key = None
+            self.synced_version = -1
 
     def __init__(self):
         MapperBase.__init__(self)
@@ -287,29 +387,66 @@ class PointSetMapper3D(MapperBase):
         MapperBase.set_node(self, node)
         node["pointsize"] = 2.0
 
+    def _release_inputs(self, ls):
+        ls.input.Initialize()
+        ls.glyph_key = None
+
     def initialize_mapper(self, renderer):
         pass
 
     def _apply_actor_properties(self, renderer):
         ls = self.lsh.get_local_storage(renderer)
-        MapperBase._apply_actor_properties(self, renderer)
-        opacity = self.node.get("opacity")
-        if opacity:
-            ls.actor.GetProperty().SetOpacity(
-                opacity)
-
-        unselectedcolor = self.node.get("unselectedcolor")
-        if not unselectedcolor:
-            unselectedcolor = [1.0, 1.0, 0.0, 1.0]
-        ls.actor.GetProperty().SetColor(
-            unselectedcolor[0], unselectedcolor[1], unselectedcolor[2])
-        if len(unselectedcolor) == 4:
-            ls.actor.GetProperty().SetOpacity(unselectedcolor[3])
+        modified = self._get_modified_properties(renderer)
+        MapperBase._apply_actor_properties(self, renderer, modified)
+        if "opacity" in modified or "unselectedcolor" in modified:
+            opacity = self.node.get("opacity")
+            if opacity:
+                ls.actor.GetProperty().SetOpacity(
+                    opacity)
+
+            unselectedcolor = self.node.get("unselectedcolor")
+            if unselectedcolor and len(unselectedcolor) == 4:
+                ls.actor.GetProperty().SetOpacity(unselectedcolor[3])
 
         representation = self.node.get("representation")
-        if representation:
+        if "representation" in modified and representation:
             update_representation(ls.actor, representation)
 
+    def _update_glyph_arrays(self, ls, data):
+        polydata = data.get_polydata()
+        point_data = polydata.GetPointData()
+        radius = self.node.get("pointsize") or 2.0
+        unselectedcolor = self.node.get("unselectedcolor") or [1.0, 1.0, 0.0]
+        selectedcolor = self.node.get("selectedcolor") or [1.0, 0.0, 0.0]
+        key = (polydata, len(data), radius, tuple(unselectedcolor[:3]), tuple(selectedcolor[:3]),
+               tuple(point_data.GetArray(name).GetMTime() if point_data.HasArray(name) else 0
+                     for name in ("radii", "colors", "selected")))
+        if key == ls.glyph_key:
+            return
+        ls.glyph_key = key
+
+        radii = data.get_attribute("radii")
+        if radii is None:
+            radii = np.full(len(data), radius, dtype=np.float32)
+        else:
+            radii = np.where(radii > 0, radii, radius).astype(np.float32)
+        colors = data.get_attribute("colors")
+        if colors is None:
+            colors = np.empty((len(data), 3), dtype=np.uint8)
+            colors[:] = np.round(np.asarray(unselectedcolor[:3]) * 255)
+        selected = data.get_attribute("selected")
+        if selected is not None and selected.any():
+            colors = colors.copy()
+            colors[selected.astype(bool)] = np.round(np.asarray(selectedcolor[:3]) * 255)
+
+        # The points are shared, only the derived arrays are replaced
+        ls.input.SetPoints(polydata.GetPoints())
+        for name, values in (("glyph_radii", radii), ("glyph_colors", colors)):
+            array = numpy_to_vtk(values, deep=0)
+            array.SetName(name)
+            ls.input.GetPointData().AddArray(array)
+        ls.input.Modified()
+
     def generate_data_for_renderer(self, renderer):
         ls = self.lsh.get_local_storage(renderer)
         if not self.node:
@@ -317,6 +454,7 @@ class PointSetMapper3D(MapperBase):
 
         data = self.node.get_data()
         if len(data) == 0:
+            ls.actor.VisibilityOff()
             return
 
         if not self.node.get("visible"):
@@ -326,28 +464,38 @@ class PointSetMapper3D(MapperBase):
             ls.actor.VisibilityOn()
 
         if data and data.type == DataType.PointSet:
-            if ls.mapper.GetInput() != data.get_pointset():
-                radius = self.node.get("pointsize")
-                if not radius:
-                    radius = 2.0
-                appender = vtkAppendPolyData()
-                for point in data.get_points_array():
-                    sphere_source = vtkSphereSource()
-                    sphere_source.SetCenter(point[0], point[1], point[2])
-                    sphere_source.SetRadius(radius)
-                   # appender.AddInputConnection(sphere_source.GetOutputPort())
-                    ls.mapper.SetInputConnection(
-                        sphere_source.GetOutputPort())
-                # self.mapper.SetInputConnection(appender.GetOutputPort())
+            self._update_glyph_arrays(ls, data)
             self._apply_actor_properties(renderer)
 
 
+# Values of the "interpolation" node property of image slices
+INTERPOLATION_MODES = {
+    "nearest": 0,
+    "linear": 1,
+    "cubic": 3,
+}
+
+
 class ImageMapper2D(MapperBase):
+    """
+    Image slices resliced along the reslice axes of the view. The reslice
+    and the actor transform are only rebuilt when the image, its modified
+    time, the reslice axes or the interpolation changed. With the slice cache
+    of the view the slices come from it, the next ones prefetched.
+    """
+    DEFAULT_INTERPOLATION = "linear"
+
     class LocalStorage:
         def __init__(self):
             self.image_actor = vtkImageActor()
             self.reslice = vtkImageReslice()
+            self.reslice.SetOutputDimensionality(2)
             self.matrix = vtkMatrix4x4()
+            self.interacting = False
+            # (image, image modified time, reslice axes, interpolation) of the slice shown
+            self.slice_key = None
+            self.slice_cache = None
+            self.synced_version = -1
 
     def __init__(self):
         MapperBase.__init__(self)
@@ -362,9 +510,30 @@ class ImageMapper2D(MapperBase):
         ls = self.lsh.get_local_storage(renderer)
         ls.matrix.SetData(matrix)
 
+    def set_interacting(self, interacting, renderer):
+        ls = self.lsh.get_local_storage(renderer)
+        ls.interacting = interacting
+
+    def set_slice_cache(self, slice_cache, renderer):
+        ls = self.lsh.get_local_storage(renderer)
+        ls.slice_cache = slice_cache
+
+    def _release_inputs(self, ls):
+        ls.reslice.RemoveAllInputs()
+        ls.slice_key = None
+        if ls.slice_cache is not None and self.node:
+            ls.slice_cache.discard(self.node.get("id"))
+
     def initialize_mapper(self, renderer):
         pass
 
+    def _get_matrix_key(self, ls):
+        return tuple(ls.matrix.GetElement(i, j) for i in range(4) for j in range(4))
+
+    def _get_interpolation(self):
+        interpolation = self.node.get("interpolation", self.DEFAULT_INTERPOLATION)
+        return INTERPOLATION_MODES.get(interpolation, INTERPOLATION_MODES[self.DEFAULT_INTERPOLATION])
+
     def generate_data_for_renderer(self, renderer):
         ls = self.lsh.get_local_storage(renderer)
         if not self.node:
@@ -376,25 +545,204 @@ class ImageMapper2D(MapperBase):
             self.get_prop(renderer).VisibilityOn()
 
         data = self.node.get_data()
-        if data and data.type == DataType.Image:
-            image = data.get_image()
-            ls.reslice.SetInputData(image)
-            ls.reslice.SetOutputDimensionality(2)
-            ls.reslice.SetResliceAxes(ls.matrix)
-            ls.reslice.SetInterpolationModeToLinear()
-            ls.reslice.Update()
-
-            # from mipf.core.utils import save_image
-            # save_image(ls.reslice.GetOutput(),f"D:/slice.mha")
-
-            ls.image_actor.SetInputData(ls.reslice.GetOutput())
-            
-            trans = vtkTransform()
-            matrix = ls.reslice.GetResliceAxes()
-            trans.SetMatrix(matrix)
-            ls.image_actor.SetUserTransform(trans)        
+        if data and data.type in IMAGE_DATA_TYPES:
+            if isinstance(data, LazyImageData) and not data.is_loaded():
+                self._generate_preview(renderer, data)
+                return
+            image = _get_render_image(self.node, data, ls.interacting)
+            slice_key = (image, image.GetMTime(), self._get_matrix_key(ls),
+                         self._get_interpolation())
+            if slice_key != ls.slice_key:
+                ls.slice_key = slice_key
+                if ls.slice_cache is not None:
+                    _, _, matrix, interpolation = slice_key
+                    output = ls.slice_cache.get_slice(image, matrix, interpolation,
+                                                      self.node.get("id"))
+                    ls.slice_cache.prefetch(image, matrix, interpolation)
+                else:
+                    output = extract_aligned_slice(image, slice_key[2], slice_key[3])
+                    if output is None:
+                        ls.reslice.SetInputData(image)
+                        ls.reslice.SetResliceAxes(ls.matrix)
+                        ls.reslice.SetInterpolationMode(slice_key[3])
+                        ls.reslice.Update()
+                        output = ls.reslice.GetOutput()
+                ls.image_actor.SetInputData(output)
+
+                trans = vtkTransform()
+                trans.SetMatrix(ls.matrix)
+                ls.image_actor.SetUserTransform(trans)
+
+            self._apply_actor_properties(renderer)
+
+    def _generate_preview(self, renderer, data):
+        """
+        Show the axial slice read directly from the file while the volume
+        loads in the background, nothing for other directions.
+        """
+        ls = self.lsh.get_local_storage(renderer)
+        ls.slice_key = None
+        data.prefetch(render_window_manager.request_view_update)
+        matrix = [ls.matrix.GetElement(i, j) for i in range(3) for j in range(3)]
+        preview = None
+        if matrix == [1, 0, 0, 0, 1, 0, 0, 0, 1]:
+            preview = data.get_axial_slice(ls.matrix.GetElement(2, 3),
+                                           render_window_manager.request_view_update)
+        if preview is None:
+            self.get_prop(renderer).VisibilityOff()
+            return
+        # Move the slice to the reslice output coordinates
+        origin = preview.GetOrigin()
+        preview.SetOrigin(origin[0] - ls.matrix.GetElement(0, 3),
+                          origin[1] - ls.matrix.GetElement(1, 3), 0)
+        ls.image_actor.SetInputData(preview)
+        trans = vtkTransform()
+        trans.SetMatrix(ls.matrix)
+        ls.image_actor.SetUserTransform(trans)
+        self._apply_actor_properties(renderer)
+
+
+# Colors of the labels 1, 2, ... cycled past the end
+LABEL_COLORS = [
+    [0.90, 0.10, 0.10], [0.10, 0.70, 0.10], [0.10, 0.30, 0.90], [0.95, 0.85, 0.10],
+    [0.10, 0.85, 0.85], [0.85, 0.10, 0.85], [1.00, 0.55, 0.10], [0.55, 0.30, 0.95],
+    [0.60, 0.90, 0.30], [0.95, 0.50, 0.65], [0.55, 0.35, 0.15], [0.70, 0.70, 0.70]]
+
+
+def _get_aligned_slice(matrix, geometry):
+    """
+    (in-plane axes, normal axis, slice index) of the grid slice shown by the
+    reslice axes matrix, None unless the in-plane axes follow the grid axes.
+    """
+    axes = get_aligned_axes([matrix.GetElement(i, j) for i in range(4) for j in range(4)],
+                            geometry.direction)
+    if axes is None:
+        return None
+    normal = axes[2]
+    index = round((matrix.GetElement(normal, 3) - geometry.origin[normal]) /
+                  geometry.spacing[normal])
+    return axes + (index,)
+
+
+class LabelMapMapper2D(ImageMapper2D):
+    """
+    Label map slices colored by label, the background transparent. Slices
+    along the grid axes are decoded alone from the label map, the other
+    ones are resliced from the decoded volume.
+    """
+    class LocalStorage(ImageMapper2D.LocalStorage):
+        def __init__(self):
+            ImageMapper2D.LocalStorage.__init__(self)
+            self.lookup_table = vtkLookupTable()
+            self.image_actor.GetProperty().SetLookupTable(self.lookup_table)
+            self.image_actor.GetProperty().UseLookupTableScalarRangeOn()
+            self.image_actor.GetProperty().SetInterpolationTypeToNearest()
+            self.max_label = -1
+
+    DEFAULT_INTERPOLATION = "nearest"
+
+    def __init__(self):
+        ImageMapper2D.__init__(self)
+        self.lsh = LocalStroageHandler(LabelMapMapper2D.LocalStorage)
+
+    def _apply_actor_properties(self, renderer):
+        ls = self.lsh.get_local_storage(renderer)
+        modified = self._get_modified_properties(renderer)
+        MapperBase._apply_actor_properties(self, renderer, modified)
+        labels = self.node.get_data().get_label_values()
+        max_label = labels[-1] if labels else 0
+        if "label_colors" in modified or "opacity" in modified or max_label != ls.max_label:
+            ls.max_label = max_label
+            # label: [r, g, b] overriding LABEL_COLORS
+            label_colors = self.node.get("label_colors") or {}
+            opacity = self.node.get("opacity") or 1.0
+            ls.lookup_table.SetNumberOfTableValues(max_label + 1)
+            ls.lookup_table.SetTableRange(0, max(max_label, 1))
+            ls.lookup_table.SetTableValue(0, 0, 0, 0, 0)
+            for label in range(1, max_label + 1):
+                color = label_colors.get(label, LABEL_COLORS[(label - 1) % len(LABEL_COLORS)])
+                ls.lookup_table.SetTableValue(label, color[0], color[1], color[2], opacity)
+            ls.lookup_table.Modified()
 
+    def generate_data_for_renderer(self, renderer):
+        ls = self.lsh.get_local_storage(renderer)
+        if not self.node:
+            return
+        if not self.node.get("visible"):
+            self.get_prop(renderer).VisibilityOff()
+            return
+        else:
+            self.get_prop(renderer).VisibilityOn()
+
+        data = self.node.get_data()
+        if not data or data.type != DataType.LabelMap:
+            return
+        aligned = _get_aligned_slice(ls.matrix, data.get_geometry())
+        if aligned is None:
+            ImageMapper2D.generate_data_for_renderer(self, renderer)
+            return
+        axis0, axis1, normal, index = aligned
+        geometry = data.get_geometry()
+        if not 0 <= index < geometry.dimensions[normal]:
+            self.get_prop(renderer).VisibilityOff()
+            return
+        slice_key = (data, data.get_version(), self._get_matrix_key(ls))
+        if slice_key == ls.slice_key:
             self._apply_actor_properties(renderer)
+            return
+        ls.slice_key = slice_key
+        labels = data.get_slice(normal, index)
+        if axis0 > axis1:
+            labels = labels.T
+        image = vtkImageData()
+        image.SetDimensions(geometry.dimensions[axis0], geometry.dimensions[axis1], 1)
+        image.SetSpacing(geometry.spacing[axis0], geometry.spacing[axis1], 1)
+        # In the coordinates of the reslice axes, like the reslice output
+        image.SetOrigin(geometry.origin[axis0] - ls.matrix.GetElement(axis0, 3),
+                        geometry.origin[axis1] - ls.matrix.GetElement(axis1, 3), 0)
+        image.GetPointData().SetScalars(
+            numpy_to_vtk(np.ascontiguousarray(labels).ravel(), deep=0))
+        ls.image_actor.SetInputData(image)
+        trans = vtkTransform()
+        trans.SetMatrix(ls.matrix)
+        ls.image_actor.SetUserTransform(trans)
+        self._apply_actor_properties(renderer)
+
+
+class LabelMapMapper3D(ImageMapper3D):
+    """
+    Label map volumes colored by label as in 2D, the background transparent.
+    """
+    class LocalStorage(ImageMapper3D.LocalStorage):
+        def __init__(self):
+            ImageMapper3D.LocalStorage.__init__(self)
+            self.volume_property.SetInterpolationTypeToNearest()
+            self.labels = None
+
+    def __init__(self):
+        ImageMapper3D.__init__(self)
+        self.lsh = LocalStroageHandler(LabelMapMapper3D.LocalStorage)
+
+    def _apply_actor_properties(self, renderer):
+        ls = self.lsh.get_local_storage(renderer)
+        modified = self._get_modified_properties(renderer)
+        MapperBase._apply_actor_properties(self, renderer, modified)
+        labels = self.node.get_data().get_label_values()
+        if "label_colors" in modified or "opacity" in modified or labels != ls.labels:
+            ls.labels = labels
+            label_colors = self.node.get("label_colors") or {}
+            opacity = self.node.get("opacity") or 1.0
+            color_function = vtkColorTransferFunction()
+            opacity_function = vtkPiecewiseFunction()
+            color_function.AddRGBPoint(0, 0, 0, 0)
+            opacity_function.AddPoint(0, 0)
+            # Sampled with nearest interpolation, only the label values are looked up
+            for label in labels:
+                color = label_colors.get(label, LABEL_COLORS[(label - 1) % len(LABEL_COLORS)])
+                color_function.AddRGBPoint(label, color[0], color[1], color[2])
+                opacity_function.AddPoint(label, opacity)
+            ls.volume_property.SetColor(color_function)
+            ls.volume_property.SetScalarOpacity(opacity_function)
 
 
 class SurfaceMapper2D(MapperBase):
@@ -408,8 +756,9 @@ class SurfaceMapper2D(MapperBase):
             self.plane = vtkPlane()
             self.cutter = vtkCutter()
             self.cutter.SetCutFunction(self.plane)
-            self.mapper.SetInputConnection(self.cutter.GetOutputPort())
-            
+            # (polydata, modified time, plane) of the contour shown
+            self.cut_key = None
+            self.synced_version = -1
 
     def __init__(self):
         MapperBase.__init__(self)
@@ -426,29 +775,37 @@ class SurfaceMapper2D(MapperBase):
     def set_node(self, node):
         MapperBase.set_node(self, node)
 
+    def _release_inputs(self, ls):
+        ls.cutter.RemoveAllInputs()
+        ls.mapper.RemoveAllInputs()
+        ls.cut_key = None
+
     def initialize_mapper(self, renderer):
         pass
 
     def _apply_actor_properties(self, renderer):
         ls = self.lsh.get_local_storage(renderer)
-        MapperBase._apply_actor_properties(self, renderer)
-        opacity = self.node.get("opacity")
-        if opacity:
-            self.get_prop(renderer).GetProperty().SetOpacity(
-                opacity)
-
-        color = self.node.get("color")
-        if color:
-            self.get_prop(renderer).GetProperty().SetColor(
-                color[0], color[1], color[2])
-            if len(color) == 4:
-                self.get_prop(renderer).GetProperty().SetOpacity(color[3])
-        
-        line_width = self.node.get("line_width")
-        if line_width:  
-            self.get_prop(renderer).GetProperty().SetLineWidth(line_width)
-        else:
-            self.get_prop(renderer).GetProperty().SetLineWidth(2)
+        modified = self._get_modified_properties(renderer)
+        MapperBase._apply_actor_properties(self, renderer, modified)
+        if "opacity" in modified or "color" in modified:
+            opacity = self.node.get("opacity")
+            if opacity:
+                self.get_prop(renderer).GetProperty().SetOpacity(
+                    opacity)
+
+            color = self.node.get("color")
+            if color:
+                self.get_prop(renderer).GetProperty().SetColor(
+                    color[0], color[1], color[2])
+                if len(color) == 4:
+                    self.get_prop(renderer).GetProperty().SetOpacity(color[3])
+
+        if "line_width" in modified:
+            line_width = self.node.get("line_width")
+            if line_width:
+                self.get_prop(renderer).GetProperty().SetLineWidth(line_width)
+            else:
+                self.get_prop(renderer).GetProperty().SetLineWidth(2)
 
     def generate_data_for_renderer(self, renderer):
         ls = self.lsh.get_local_storage(renderer)
@@ -461,17 +818,26 @@ class SurfaceMapper2D(MapperBase):
             self.get_prop(renderer).VisibilityOn()
         data = self.node.get_data()
         if data and data.type == DataType.Surface:
-            if ls.mapper.GetInput() != data.get_polydata():      
-                ls.plane.SetOrigin(
-                    ls.matrix.GetElement(0, 3),
-                    ls.matrix.GetElement(1, 3),
-                    ls.matrix.GetElement(2, 3)
-                )
-                ls.plane.SetNormal(
-                    ls.matrix.GetElement(0, 2),
-                    ls.matrix.GetElement(1, 2),
-                    ls.matrix.GetElement(2, 2)
-                )
-                ls.cutter.SetInputData(data.get_polydata())
-                
+            if isinstance(data, LazySurfaceData) and not data.is_loaded():
+                # Shown once read on the io_manager pool
+                self.get_prop(renderer).VisibilityOff()
+                data.prefetch(render_window_manager.request_view_update)
+                return
+            polydata = data.get_polydata()
+            origin = tuple(ls.matrix.GetElement(i, 3) for i in range(3))
+            normal = tuple(ls.matrix.GetElement(i, 2) for i in range(3))
+            cut_key = (polydata, polydata.GetMTime(), origin, normal)
+            if cut_key != ls.cut_key:
+                ls.cut_key = cut_key
+                # Axis-aligned planes only cut the cells around them, others the whole mesh
+                contour = data.get_cut_index().cut(origin, normal)
+                if contour is None:
+                    ls.plane.SetOrigin(origin)
+                    ls.plane.SetNormal(normal)
+                    ls.cutter.SetInputData(polydata)
+                    ls.cutter.Update()
+                    contour = vtkPolyData()
+                    contour.ShallowCopy(ls.cutter.GetOutput())
+                ls.mapper.SetInputData(contour)
+
             self._apply_actor_properties(renderer)
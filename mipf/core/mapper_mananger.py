@@ -1,5 +1,6 @@
 from collections import defaultdict
 from mipf.core.mapper import *
+from mipf.core.data_manager import data_manager
 
 class MapperManager:
     """
@@ -23,4 +24,11 @@ class MapperManager:
             return None
 
 
+    def release_inputs(self, uid):
+        for mapper in self.mappers.get(uid, {}).values():
+            mapper.release_inputs()
+
+
 mapper_manager = MapperManager()
+# Let the spilled data be freed
+data_manager.register_eviction_callback(mapper_manager.release_inputs)
@@ -0,0 +1,103 @@
+import struct
+
+import numpy as np
+
+from mipf.core.gzip_index import get_gzip_index
+
+
+NIFTI_DATA_TYPES = {
+    2: np.uint8,
+    4: np.int16,
+    8: np.int32,
+    16: np.float32,
+    64: np.float64,
+    256: np.int8,
+    512: np.uint16,
+    768: np.uint32,
+    1024: np.int64,
+    1280: np.uint64,
+}
+
+
+def parse_nifti1_header(raw: bytes) -> dict:
+    """
+    Parse the fields of a NIfTI-1 header needed to locate the voxels.
+    """
+    if len(raw) < 348:
+        raise ValueError("Truncated NIfTI header")
+    endian = "<" if struct.unpack("<i", raw[:4])[0] == 348 else ">"
+    if struct.unpack(endian + "i", raw[:4])[0] != 348:
+        raise ValueError("Not a NIfTI-1 header")
+    dim = struct.unpack(endian + "8h", raw[40:56])
+    datatype = struct.unpack(endian + "h", raw[70:72])[0]
+    pixdim = struct.unpack(endian + "8f", raw[76:108])
+    vox_offset = struct.unpack(endian + "f", raw[108:112])[0]
+    qform_code = struct.unpack(endian + "h", raw[252:254])[0]
+    if datatype not in NIFTI_DATA_TYPES:
+        raise ValueError(f"Unsupported NIfTI data type {datatype}")
+    return {
+        "dimensions": [max(1, dim[i]) if i <= dim[0] else 1 for i in range(1, 4)],
+        "dtype": np.dtype(NIFTI_DATA_TYPES[datatype]).newbyteorder(endian),
+        # qfac is only meaningful with a qform
+        "qfac": -1.0 if qform_code > 0 and pixdim[0] < 0 else 1.0,
+        "vox_offset": int(vox_offset),
+    }
+
+
+class NiftiSliceReader:
+    """
+    Read single axial slices of a .nii or .nii.gz file without decoding the volume.
+    Compressed files are accessed through a shared GzipIndex, so only the bytes
+    from the closest seek point up to the slice are inflated.
+    Slices are numbered as in the vtkNIFTIImageReader output, which reverses
+    the slice order when qfac is -1.
+    """
+
+    def __init__(self, filename: str):
+        self.filename = filename
+        self._index = None
+        if filename.lower().endswith(".gz"):
+            self._index = get_gzip_index(filename)
+        self.header = parse_nifti1_header(self._read(0, 348))
+
+    def _read(self, offset, size):
+        if self._index:
+            return self._index.read(offset, size)
+        with open(self.filename, "rb") as f:
+            f.seek(offset)
+            return f.read(size)
+
+    def is_ready(self):
+        """
+        Whether slices are read without inflating from the start of the file.
+        """
+        return self._index is None or self._index.is_complete()
+
+    def prepare(self, callback=None):
+        """
+        Build the index of a compressed file on the io_manager pool, or import
+        the one persisted by a previous build. callback() is called on the
+        event loop thread once ready.
+        """
+        if self._index is not None and not self._index.is_complete():
+            self._index.build_async(callback)
+
+    def get_number_of_slices(self):
+        return self.header["dimensions"][2]
+
+    def read_axial_slice(self, index: int) -> np.ndarray:
+        """
+        Voxels of the slice as a (rows, columns) array in native byte order.
+        """
+        nx, ny, nz = self.header["dimensions"]
+        if index < 0 or index >= nz:
+            raise IndexError(f"Slice {index} is out of range [0, {nz})")
+        if self.header["qfac"] < 0:
+            index = nz - 1 - index
+        dtype = self.header["dtype"]
+        size = nx * ny * dtype.itemsize
+        raw = self._read(self.header["vox_offset"] + index * size, size)
+        if len(raw) < size:
+            raise ValueError(f"Truncated NIfTI file {self.filename}")
+        voxels = np.frombuffer(raw, dtype=dtype)
+        return voxels.astype(dtype.newbyteorder("="), copy=False).reshape(ny, nx)
@@ -35,6 +35,9 @@ class PipelineManager:
         return list_to_fill
 
     def add_node(self, node: DataNode, parent_node=None, **item_keys):
+        if self.data_storage.is_sending_batch():
+            # Handled by batch_changed
+            return node["id"]
         _layer_id = f"{self._next_id}"
         self._next_id += 1
         
@@ -43,17 +46,32 @@ class PipelineManager:
             **item_keys,
             "view_layer":_layer_id
         }
-        node.properties.update(
+        node.update(
             append_keys
         )
         self.update()
         return node["id"]
 
     def remove_node(self, _id):
+        if not self.data_storage.is_sending_batch():
+            self.update()
+
+    def batch_changed(self, added, removed, modified):
+        for _id in added:
+            node = self.data_storage.get_node(_id)
+            if node is None:
+                continue
+            node.update({
+                **{k: v for k, v in PipelineManager.DEFAULT_NODE.items()
+                   if k not in node.properties},
+                "view_layer": f"{self._next_id}"
+            })
+            self._next_id += 1
         self.update()
         
     def modified_node(self, _id):
-        self.update()
+        if not self.data_storage.is_sending_batch():
+            self.update()
 
     def toggle_collapsed(self, _id, icons=["collapsed", "collapsible"]):
         node = self.get_node(_id)
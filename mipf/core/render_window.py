@@ -16,6 +16,7 @@ from mipf.core.data import DataStorage
 from mipf.core.render_window_manager import render_window_manager
 from mipf.core.mapper_mananger import mapper_manager
 from mipf.core.settings import *
+from mipf.core.slice_cache import SliceCache
 
 
 class ViewDirection(Enum):
@@ -93,6 +94,10 @@ class RenderWindow:
         self.data_storage = data_storage
         self.shift = [0, 0, 0]
         self.interactor_style = None
+        self.interacting = False
+        self.slice_cache = None
+        data_storage.register_callback(self._on_node_removed,
+                                       DataStorage.DataStorageEvent.REMOVE_NODE)
 
         render_window_manager.add_renderwindow(self)
 
@@ -131,14 +136,29 @@ class RenderWindow:
         else:
             return None
 
+    def get_slice_cache(self) -> SliceCache:
+        """
+        Cache of the resliced images of the view, created on first use.
+        """
+        if self.slice_cache is None:
+            self.slice_cache = SliceCache(general_settings.slice_cache_size,
+                                          general_settings.slice_prefetch_count)
+        return self.slice_cache
+
+    def _on_node_removed(self, _id):
+        # Cached slices of a removed node would keep their images alive
+        if self.slice_cache is not None:
+            self.slice_cache.discard(_id)
+
     def _get_direction_matrix(self):
         matrix = None
+        # Copies, the shifts of the views must not leak into the shared matrices
         if self.direction == ViewDirection.Axial:
-            matrix = ResliceMatrix.Axial_Matrix
+            matrix = list(ResliceMatrix.Axial_Matrix)
         elif self.direction == ViewDirection.Sagittal:
-            matrix = ResliceMatrix.Sagittal_Matrix
+            matrix = list(ResliceMatrix.Sagittal_Matrix)
         elif self.direction == ViewDirection.Coronal:
-            matrix = ResliceMatrix.Coronal_Matrix
+            matrix = list(ResliceMatrix.Coronal_Matrix)
         else:
             raise ValueError(f"Invalid direction {self.direction}!")
 
@@ -151,8 +171,10 @@ class RenderWindow:
         data = node.get_data()
         if data.type.value == DataType.Surface.value:
             return SurfaceMapper3D()
-        elif data.type.value == DataType.Image.value:
+        elif data.type.value in (DataType.Image.value, DataType.TimeSeries.value):
             return ImageMapper3D()
+        elif data.type.value == DataType.LabelMap.value:
+            return LabelMapMapper3D()
         elif data.type.value == DataType.PointSet.value:
             return PointSetMapper3D()
         else:
@@ -163,8 +185,10 @@ class RenderWindow:
         data = node.get_data()
         if data.type.value == DataType.Surface.value:
             return SurfaceMapper2D()  # not support yet
-        elif data.type.value == DataType.Image.value:
+        elif data.type.value in (DataType.Image.value, DataType.TimeSeries.value):
             return ImageMapper2D()
+        elif data.type.value == DataType.LabelMap.value:
+            return LabelMapMapper2D()
         elif data.type.value == DataType.PointSet.value:
             return None  # not support yet
         else:
@@ -215,6 +239,7 @@ class RenderWindow:
                         mapper_manager.set_mapper(
                             node, mapper, MapperType.Mapper_3D)
                 if mapper:
+                    mapper.set_interacting(self.interacting, self.renderer)
                     mapper.generate_data_for_renderer(self.renderer)
                     self.renderer.AddViewProp(mapper.get_prop(self.renderer))
             elif self.view_type == ViewType.View2D:
@@ -225,12 +250,23 @@ class RenderWindow:
                         mapper_manager.set_mapper(
                             node, mapper, MapperType.Mapper_2D)
                 if mapper:
+                    mapper.set_interacting(self.interacting, self.renderer)
+                    mapper.set_slice_cache(self.get_slice_cache(), self.renderer)
                     mapper.set_reslice_matrix(
                         self._get_direction_matrix(), self.renderer)
                     mapper.generate_data_for_renderer(self.renderer)
                     self.renderer.AddViewProp(mapper.get_prop(self.renderer))
         self.vtk_render_window.Render()
 
+    def _on_start_interaction(self, obj, event):
+        # Switch the image mappers to a coarse pyramid level
+        self.interacting = True
+        self.update()
+
+    def _on_end_interaction(self, obj, event):
+        self.interacting = False
+        self.update()
+
     def setup(self):
         if self.view_type == ViewType.View2D:
             self.interactor_style = ImageInteractor2D(self.direction, self)
@@ -238,12 +274,14 @@ class RenderWindow:
             interactor.SetRenderWindow(self.vtk_render_window)
             interactor.SetInteractorStyle(self.interactor_style)
             self.get_active_camera().ParallelProjectionOn()
-            self.renderer.ResetCamera()
-            self.update()
         else:
             self.interactor_style = vtkInteractorStyleTrackballCamera()
             interactor = vtkRenderWindowInteractor()
             interactor.SetRenderWindow(self.vtk_render_window)
             interactor.SetInteractorStyle(self.interactor_style)
-            self.renderer.ResetCamera()
-            self.update()
+        self.interactor_style.AddObserver(
+            "StartInteractionEvent", self._on_start_interaction)
+        self.interactor_style.AddObserver(
+            "EndInteractionEvent", self._on_end_interaction)
+        self.renderer.ResetCamera()
+        self.update()
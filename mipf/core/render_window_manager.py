@@ -5,6 +5,8 @@ class RenderWindowManager:
 
     def __init__(self):
         self.render_windows = []
+        # Pushes the rendered views to the clients, set by the application
+        self.view_update = None
 
     def add_renderwindow(self, render_window):
         self.render_windows.append(render_window)
@@ -19,5 +21,10 @@ class RenderWindowManager:
         for render_window in self.render_windows:
             render_window.update()
 
+    def request_view_update(self):
+        self.request_update_all()
+        if self.view_update:
+            self.view_update()
+
 
 render_window_manager = RenderWindowManager()
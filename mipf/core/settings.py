@@ -2,6 +2,14 @@ class GeneralSettings:
     def __init__(self):
         self.background_color_3d = [0.33, 0.35, 0.43]
         self.background_color_2d = [0, 0, 0]
+        # Directory for spooling uploads, system temp directory if None
+        self.spool_directory = None
+        # Build downsampled levels of every loaded image for interactive rendering
+        self.build_image_pyramid = False
+        self.image_pyramid_min_size = 64
+        # Resliced slices cached per 2D view in bytes, and slices prefetched ahead of scrolling
+        self.slice_cache_size = 256 * 1024 ** 2
+        self.slice_prefetch_count = 4
 
 
 general_settings = GeneralSettings()
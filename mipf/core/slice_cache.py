@@ -0,0 +1,283 @@
+import threading
+from collections import OrderedDict
+
+import numpy as np
+from vtkmodules.vtkCommonDataModel import vtkImageData
+from vtkmodules.vtkCommonMath import vtkMatrix4x4
+from vtkmodules.vtkImagingCore import vtkImageReslice
+from vtkmodules.util.numpy_support import numpy_to_vtk, vtk_to_numpy
+
+
+IDENTITY_DIRECTION = (1, 0, 0, 0, 1, 0, 0, 0, 1)
+# vtkImageReslice rounds positions and values to 16.16 fixed point before flooring them
+FIXED_POINT_SCALE = 65536.0
+
+
+def _to_fixed_point(values):
+    return np.rint(np.multiply(values, FIXED_POINT_SCALE)) / FIXED_POINT_SCALE
+
+
+def get_aligned_axes(matrix, direction=IDENTITY_DIRECTION):
+    """
+    (first in-plane axis, second in-plane axis, normal axis) of the 16 values
+    of reslice axes whose in-plane axes follow the grid axes of an image of
+    the 9 values of direction, None for other ones.
+    """
+    if tuple(direction) != IDENTITY_DIRECTION:
+        return None
+    axes = []
+    for j in range(2):
+        column = [matrix[4 * i + j] for i in range(3)]
+        if sorted(column) != [0, 0, 1]:
+            return None
+        axes.append(column.index(1))
+    if axes[0] == axes[1]:
+        return None
+    return axes[0], axes[1], 3 - axes[0] - axes[1]
+
+
+def extract_aligned_slice(image: vtkImageData, matrix, interpolation: int,
+                          copy: bool = False) -> vtkImageData:
+    """
+    Same slice as reslice_image read from the scalars with NumPy when the
+    reslice axes follow the image grid, sharing the scalars for axial slices
+    on the grid unless copy. Off the grid the nearest slice or, for linear
+    interpolation, the blend of the two nearest ones is taken. None if not
+    applicable.
+    """
+    direction = image.GetDirectionMatrix()
+    axes = get_aligned_axes(matrix, [direction.GetElement(i, j)
+                                     for i in range(3) for j in range(3)])
+    if axes is None:
+        return None
+    axis0, axis1, normal = axes
+    origin, spacing, extent = image.GetOrigin(), image.GetSpacing(), image.GetExtent()
+    dims = image.GetDimensions()
+    scalars = vtk_to_numpy(image.GetPointData().GetScalars())
+    volume = scalars.reshape((dims[2], dims[1], dims[0]) + scalars.shape[1:])
+    position = (matrix[4 * normal + 3] - origin[normal]) / spacing[normal] - extent[2 * normal]
+    position = float(_to_fixed_point(position))
+    nearest = int(np.floor(position + 0.5))
+
+    def take(k):
+        return volume[(slice(None),) * (2 - normal) + (k,)]
+
+    if abs(position - nearest) < 1e-6 or interpolation == 0:
+        plane = take(nearest) if 0 <= nearest < dims[normal] else None
+    elif interpolation == 1:
+        # Clamped to the edge slices within half a voxel, like the border of vtkImageReslice
+        if -0.5 <= position <= dims[normal] - 0.5:
+            position = min(max(position, 0), dims[normal] - 1)
+        k = int(np.floor(position))
+        plane = None
+        if position == k and 0 <= k < dims[normal]:
+            plane = take(k)
+        elif 0 <= k and k + 1 < dims[normal]:
+            weight = position - k
+            # In the precision of vtkImageReslice, in place to spare temporaries
+            plane = take(k).astype(np.float32 if scalars.dtype != np.float64 else np.float64)
+            plane *= 1 - weight
+            plane += weight * take(k + 1)
+            if np.issubdtype(scalars.dtype, np.integer):
+                plane += 0.5
+                plane = np.floor(_to_fixed_point(plane))
+            plane = plane.astype(scalars.dtype)
+    else:
+        return None
+    if plane is None:
+        # Outside of the image, the background of vtkImageReslice
+        plane = np.zeros((dims[max(axis0, axis1)], dims[min(axis0, axis1)]) + scalars.shape[1:],
+                         dtype=scalars.dtype)
+    if axis0 > axis1:
+        plane = plane.swapaxes(0, 1)
+    # Axial planes on the grid are contiguous and shared, the others copied
+    plane = np.ascontiguousarray(plane)
+    if copy and np.may_share_memory(plane, scalars):
+        plane = plane.copy()
+
+    output = vtkImageData()
+    output.SetExtent(extent[2 * axis0], extent[2 * axis0 + 1],
+                     extent[2 * axis1], extent[2 * axis1 + 1], 0, 0)
+    output.SetSpacing(spacing[axis0], spacing[axis1], spacing[normal])
+    output.SetOrigin(origin[axis0] - matrix[4 * axis0 + 3],
+                     origin[axis1] - matrix[4 * axis1 + 3], 0)
+    array = numpy_to_vtk(plane.reshape(output.GetNumberOfPoints(), -1), deep=0)
+    array.SetName("ImageScalars")
+    output.GetPointData().SetScalars(array)
+    return output
+
+
+def reslice_image(image: vtkImageData, matrix, interpolation: int,
+                  copy: bool = False) -> vtkImageData:
+    """
+    2D slice of the image along the 16 values of the reslice axes, in the
+    coordinates of the axes like the output of vtkImageReslice. With copy it
+    never shares the scalars of the image.
+    """
+    output = extract_aligned_slice(image, matrix, interpolation, copy)
+    if output is not None:
+        return output
+    axes = vtkMatrix4x4()
+    axes.DeepCopy(matrix)
+    reslice = vtkImageReslice()
+    reslice.SetInputData(image)
+    reslice.SetOutputDimensionality(2)
+    reslice.SetResliceAxes(axes)
+    reslice.SetInterpolationMode(interpolation)
+    reslice.Update()
+    output = vtkImageData()
+    output.ShallowCopy(reslice.GetOutput())
+    return output
+
+
+class SliceCache:
+    """
+    Least recently used resliced 2D images of one view, keyed by image
+    identity, image modified time, reslice axes and interpolation, up to
+    max_bytes. prefetch reslices the next slices in the direction the reslice
+    axes last moved on a worker thread, so scrolling on finds them ready.
+    The cached slices never share the scalars of their image, which a removed
+    or spilled node would otherwise keep in memory, and discard drops the
+    slices of the images of an owner, e.g. a node id.
+    """
+
+    def __init__(self, max_bytes=256 * 1024 ** 2, prefetch_count=4):
+        self.max_bytes = max_bytes
+        self.prefetch_count = prefetch_count
+        self._slices = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self._condition = threading.Condition(self._lock)
+        # image id: reslice axes of its last prefetch
+        self._last_matrices = {}
+        # image id: owner, slices are only cached for the images listed
+        self._owners = {}
+        self._job = None
+        self._worker = None
+
+    @staticmethod
+    def get_key(image: vtkImageData, matrix, interpolation: int):
+        # The modified time is global, an image reusing the id of a deleted one differs by it
+        return (id(image), image.GetMTime(), tuple(matrix), interpolation)
+
+    def get(self, key) -> vtkImageData:
+        with self._lock:
+            output = self._slices.get(key)
+            if output is not None:
+                self._slices.move_to_end(key)
+            return output
+
+    def put(self, key, output: vtkImageData):
+        size = output.GetActualMemorySize() * 1024
+        with self._lock:
+            if key in self._slices or key[0] not in self._owners:
+                return
+            self._slices[key] = output
+            self._size += size
+            while self._size > self.max_bytes and len(self._slices) > 1:
+                _, evicted = self._slices.popitem(last=False)
+                self._size -= evicted.GetActualMemorySize() * 1024
+
+    def get_slice(self, image: vtkImageData, matrix, interpolation: int,
+                  owner=None) -> vtkImageData:
+        """
+        Cached slice, resliced and cached if missing.
+        """
+        key = SliceCache.get_key(image, matrix, interpolation)
+        output = self.get(key)
+        if output is None:
+            with self._lock:
+                self._owners[id(image)] = owner
+            output = reslice_image(image, matrix, interpolation, copy=True)
+            self.put(key, output)
+        return output
+
+    def get_memory_size(self):
+        return self._size
+
+    def clear(self):
+        with self._lock:
+            self._slices.clear()
+            self._size = 0
+            self._last_matrices.clear()
+            self._owners.clear()
+            self._job = None
+
+    def discard(self, owner):
+        """
+        Drop the slices and the prefetch state of the images of owner.
+        """
+        with self._lock:
+            images = {image for image, image_owner in self._owners.items() if image_owner == owner}
+            for image in images:
+                del self._owners[image]
+                self._last_matrices.pop(image, None)
+            for key in [key for key in self._slices if key[0] in images]:
+                self._size -= self._slices.pop(key).GetActualMemorySize() * 1024
+            if self._job is not None and self._job[2][0][0] in images:
+                self._job = None
+
+    def prefetch(self, image: vtkImageData, matrix, interpolation: int):
+        """
+        Queue the next prefetch_count slices after matrix, stepping as from
+        the previous matrix given for the image, replacing the queued ones.
+        Only for images of which get_slice was called.
+        """
+        matrix = tuple(matrix)
+        with self._lock:
+            if id(image) not in self._owners:
+                return
+            previous = self._last_matrices.get(id(image))
+            self._last_matrices[id(image)] = matrix
+        if previous is None or self.prefetch_count <= 0:
+            return
+        current = np.reshape(matrix, (4, 4))
+        step = current[:3, 3] - np.reshape(previous, (4, 4))[:3, 3]
+        if not step.any() or not np.array_equal(current[:3, :3],
+                                                np.reshape(previous, (4, 4))[:3, :3]):
+            return
+
+        # Positions of the corners along the slice normal, to stop past the image
+        bounds = image.GetBounds()
+        normal = current[:3, 2]
+        corners = np.array([[x, y, z] for x in bounds[:2] for y in bounds[2:4] for z in bounds[4:]])
+        depths = corners @ normal
+        matrices = []
+        for i in range(1, self.prefetch_count + 1):
+            ahead = current.copy()
+            ahead[:3, 3] += i * step
+            if not depths.min() <= ahead[:3, 3] @ normal <= depths.max():
+                break
+            matrices.append(tuple(ahead.ravel().tolist()))
+        matrices = [m for m in matrices
+                    if self.get(SliceCache.get_key(image, m, interpolation)) is None]
+        if not matrices:
+            return
+
+        # The worker reads a shallow copy, never the pipeline of the view
+        source = vtkImageData()
+        source.ShallowCopy(image)
+        keys = [SliceCache.get_key(image, m, interpolation) for m in matrices]
+        with self._condition:
+            self._job = (source, matrices, keys, interpolation)
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._run, daemon=True,
+                                                 name="mipf_slice_prefetch")
+                self._worker.start()
+            self._condition.notify()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while self._job is None:
+                    if not self._condition.wait(timeout=30):
+                        self._worker = None
+                        return
+                job, self._job = self._job, None
+            source, matrices, keys, interpolation = job
+            for matrix, key in zip(matrices, keys):
+                if self._job is not None:
+                    # A newer position, drop the rest
+                    break
+                if self.get(key) is None:
+                    self.put(key, reslice_image(source, matrix, interpolation, copy=True))
@@ -0,0 +1,147 @@
+from collections import OrderedDict
+
+import numpy as np
+from vtkmodules.vtkCommonCore import vtkPoints
+from vtkmodules.vtkCommonDataModel import vtkPolyData, vtkCellArray, vtkPlane
+from vtkmodules.vtkFiltersCore import vtkCutter
+from vtkmodules.util.numpy_support import vtk_to_numpy, numpy_to_vtk, numpy_to_vtkIdTypeArray
+
+
+def _copy_tuples(source_data, target_data, ids):
+    """
+    Add the tuples ids of every array of source_data to target_data, keeping
+    the names and the active attributes.
+    """
+    for i in range(source_data.GetNumberOfArrays()):
+        source = source_data.GetArray(i)
+        if source is None:
+            continue
+        array = numpy_to_vtk(vtk_to_numpy(source)[ids], deep=1, array_type=source.GetDataType())
+        array.SetName(source.GetName())
+        target_data.AddArray(array)
+        for attribute in range(5):
+            if source_data.GetAbstractAttribute(attribute) is source:
+                target_data.SetActiveAttribute(array.GetName(), attribute)
+
+
+class SurfaceCutIndex:
+    """
+    Cell extents of a surface sorted along each axis, built on the first cut
+    normal to the axis. Cuts normal to an axis only pass the cells straddling
+    the plane to vtkCutter, found by binary search among the cells no longer
+    than most of them and by a linear scan of the few longer ones. The
+    contours of the last cache_size positions are kept.
+    """
+
+    def __init__(self, polydata: vtkPolyData, cache_size=64):
+        self.polydata = polydata
+        self.mtime = polydata.GetMTime()
+        self.cache_size = cache_size
+        self._axes = {}
+        self._contours = OrderedDict()
+        self._connectivity = None
+        self._offsets = None
+        polys = polydata.GetPolys()
+        # Only surfaces made of polygons, e.g. not of strips or lines
+        if polydata.GetNumberOfCells() == polys.GetNumberOfCells() > 0:
+            offsets = vtk_to_numpy(polys.GetOffsetsArray())
+            if np.all(np.diff(offsets) > 0):
+                self._connectivity = vtk_to_numpy(polys.GetConnectivityArray())
+                self._offsets = offsets
+
+    def is_supported(self):
+        return self._offsets is not None
+
+    def get_memory_size(self):
+        size = sum(array.nbytes for axis in self._axes.values() for array in axis[:5])
+        return size + sum(contour.GetActualMemorySize() * 1024
+                          for contour in self._contours.values())
+
+    def _get_axis(self, axis):
+        """
+        (sorted minima, maxima in that order, cells in that order, long cells,
+        their extents, length limit of the sorted cells) along the axis.
+        """
+        if axis not in self._axes:
+            coordinates = vtk_to_numpy(self.polydata.GetPoints().GetData())[:, axis]
+            values = coordinates[self._connectivity]
+            minima = np.minimum.reduceat(values, self._offsets[:-1]).astype(np.float32)
+            maxima = np.maximum.reduceat(values, self._offsets[:-1]).astype(np.float32)
+            lengths = maxima - minima
+            limit = float(np.quantile(lengths, 0.99))
+            long_cells = np.flatnonzero(lengths > limit)
+            cells = np.flatnonzero(lengths <= limit)
+            order = cells[np.argsort(minima[cells], kind="stable")]
+            self._axes[axis] = (minima[order], maxima[order], order.astype(np.int64),
+                                long_cells, np.stack([minima[long_cells], maxima[long_cells]]),
+                                limit)
+        return self._axes[axis]
+
+    def get_cells(self, axis: int, position: float) -> np.ndarray:
+        """
+        Sorted ids of the cells whose extent along the axis holds position.
+        """
+        minima, maxima, order, long_cells, long_extents, limit = self._get_axis(axis)
+        # float32 extents, widened so rounding drops no straddling cell
+        margin = 1e-6 * max(abs(position), 1.0)
+        start = np.searchsorted(minima, position - limit - margin, side="left")
+        end = np.searchsorted(minima, position + margin, side="right")
+        cells = order[start:end][maxima[start:end] >= position - margin]
+        inside = (long_extents[0] <= position + margin) & (long_extents[1] >= position - margin)
+        return np.sort(np.concatenate([cells, long_cells[inside]]))
+
+    def extract_cells(self, cells: np.ndarray) -> vtkPolyData:
+        """
+        Polydata of the cells with only their points, as vtkCutter evaluates
+        the plane at every point of its input, and their point and cell data.
+        """
+        starts = self._offsets[cells]
+        sizes = self._offsets[cells + 1] - starts
+        offsets = np.zeros(len(cells) + 1, dtype=np.int64)
+        np.cumsum(sizes, out=offsets[1:])
+        indices = np.repeat(starts - offsets[:-1], sizes) + np.arange(offsets[-1])
+        used, connectivity = np.unique(self._connectivity[indices], return_inverse=True)
+        polys = vtkCellArray()
+        polys.SetData(numpy_to_vtkIdTypeArray(offsets, deep=1),
+                      numpy_to_vtkIdTypeArray(connectivity.astype(np.int64).ravel(), deep=1))
+        subset = vtkPolyData()
+        points = vtkPoints()
+        points.SetData(numpy_to_vtk(
+            vtk_to_numpy(self.polydata.GetPoints().GetData())[used], deep=1))
+        subset.SetPoints(points)
+        subset.SetPolys(polys)
+        _copy_tuples(self.polydata.GetPointData(), subset.GetPointData(), used)
+        # The polygons are all the cells, their ids are the cell ids
+        _copy_tuples(self.polydata.GetCellData(), subset.GetCellData(), cells)
+        return subset
+
+    def cut(self, origin, normal) -> vtkPolyData:
+        """
+        Contour of the plane, None if the plane is not normal to an axis or
+        the surface is not made of polygons.
+        """
+        normal = np.asarray(normal, dtype=np.float64)
+        axes = np.flatnonzero(normal)
+        if not self.is_supported() or len(axes) != 1:
+            return None
+        axis = int(axes[0])
+        position = float(origin[axis])
+        key = (axis, position)
+        contour = self._contours.get(key)
+        if contour is not None:
+            self._contours.move_to_end(key)
+            return contour
+
+        plane = vtkPlane()
+        plane.SetOrigin(origin)
+        plane.SetNormal(normal)
+        cutter = vtkCutter()
+        cutter.SetCutFunction(plane)
+        cutter.SetInputData(self.extract_cells(self.get_cells(axis, position)))
+        cutter.Update()
+        contour = vtkPolyData()
+        contour.ShallowCopy(cutter.GetOutput())
+        self._contours[key] = contour
+        if len(self._contours) > self.cache_size:
+            self._contours.popitem(last=False)
+        return contour
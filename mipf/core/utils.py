@@ -1,91 +1,591 @@
 from vtkmodules.vtkIOImage import (
     vtkNIFTIImageReader,
     vtkMetaImageReader,
+    vtkNrrdReader,
     vtkNIFTIImageWriter,
     vtkMetaImageWriter)
 from vtkmodules.vtkIOXML import (
     vtkXMLPolyDataReader,
     vtkXMLImageDataReader,
     vtkXMLPolyDataWriter,
-    vtkXMLImageDataWriter)
+    vtkXMLImageDataWriter,
+    vtkXMLWriter)
 from vtkmodules.vtkIOGeometry import (
     vtkSTLReader,
     vtkSTLWriter
 )
+from vtkmodules.vtkIOPLY import (
+    vtkPLYReader,
+    vtkPLYWriter
+)
 from vtkmodules.vtkCommonDataModel import (
     vtkImageData,
-    vtkPolyData
+    vtkPolyData,
+    vtkDataObject
 )
+from vtkmodules.vtkCommonExecutionModel import vtkStreamingDemandDrivenPipeline
+from vtkmodules.util.numpy_support import numpy_to_vtk, vtk_to_numpy
+from mipf.core.data_cache import data_cache
+import os
+import sys
+import tempfile
+import zlib
+import numpy as np
 
 
-def load_image(filename: str) -> vtkImageData:
-    if filename.endswith('nii') or filename.endswith('nii.gz'):
-        reader = vtkNIFTIImageReader()
-        reader.SetFileName(filename)
-        reader.Update()
-        return reader.GetOutput()
-    if filename.endswith('vti'):
-        reader = vtkXMLImageDataReader()
-        reader.SetFileName(filename)
-        reader.Update()
-        return reader.GetOutput()
-    if filename.endswith('mha'):
-        reader = vtkMetaImageReader()
-        reader.SetFileName(filename)
-        reader.Update()
-        return reader.GetOutput()
+META_IMAGE_ELEMENT_TYPES = {
+    "MET_CHAR": np.int8,
+    "MET_UCHAR": np.uint8,
+    "MET_SHORT": np.int16,
+    "MET_USHORT": np.uint16,
+    "MET_INT": np.int32,
+    "MET_UINT": np.uint32,
+    "MET_LONG": np.int32,
+    "MET_ULONG": np.uint32,
+    "MET_LONG_LONG": np.int64,
+    "MET_ULONG_LONG": np.uint64,
+    "MET_FLOAT": np.float32,
+    "MET_DOUBLE": np.float64,
+}
+
+
+def read_meta_image_header(filename: str) -> dict:
+    """
+    Parse the text header of a MetaImage(.mha/.mhd) file.
+    The returned dict also holds "HeaderBytes", the byte offset right after
+    the "ElementDataFile" line where LOCAL voxel data starts.
+    """
+    header = {}
+    offset = 0
+    with open(filename, "rb") as f:
+        for line in f:
+            offset += len(line)
+            text = line.decode("latin-1").strip()
+            if not text or "=" not in text:
+                continue
+            key, value = text.split("=", 1)
+            header[key.strip()] = value.strip()
+            if key.strip() == "ElementDataFile":
+                break
+    header["HeaderBytes"] = offset
+    return header
+
+
+def _meta_image_geometry(header: dict):
+    dims = [int(x) for x in header.get("DimSize", "").split()]
+    ndims = len(dims)
+    spacing = [float(x) for x in header.get(
+        "ElementSpacing", header.get("ElementSize", "1 " * ndims)).split()]
+    origin = [float(x) for x in header.get(
+        "Offset", header.get("Origin", header.get("Position", "0 " * ndims))).split()]
+    return (dims[:3] + [1] * (3 - ndims),
+            spacing[:3] + [1.0] * (3 - len(spacing)),
+            origin[:3] + [0.0] * (3 - len(origin)))
+
+
+def load_meta_image_mmap(filename: str) -> vtkImageData:
+    """
+    Wrap the voxels of an uncompressed MetaImage as a copy-on-write numpy.memmap
+    and expose it to vtk as the image scalars without copying.
+    Return None if the file can not be mapped(compressed, foreign byte order,
+    multi-file data...), the caller should fall back to vtkMetaImageReader.
+    """
+    header = read_meta_image_header(filename)
+    if header.get("CompressedData", "False").lower() == "true":
+        return None
+    dtype = META_IMAGE_ELEMENT_TYPES.get(header.get("ElementType"))
+    data_file = header.get("ElementDataFile")
+    if dtype is None or not data_file or data_file == "LIST" or "%" in data_file:
+        return None
+    msb = header.get("BinaryDataByteOrderMSB",
+                     header.get("ElementByteOrderMSB", "False"))
+    if (msb.lower() == "true") != (sys.byteorder == "big"):
+        if np.dtype(dtype).itemsize > 1:
+            return None
+
+    if len(header.get("DimSize", "").split()) not in (1, 2, 3):
+        return None
+    dims, spacing, origin = _meta_image_geometry(header)
+    channels = int(header.get("ElementNumberOfChannels", 1))
+
+    count = dims[0] * dims[1] * dims[2] * channels
+    nbytes = count * np.dtype(dtype).itemsize
+    if data_file == "LOCAL":
+        data_file = filename
+        offset = header["HeaderBytes"]
     else:
+        data_file = os.path.join(os.path.dirname(filename), data_file)
+        offset = int(header.get("HeaderSize", 0))
+        if offset == -1:
+            offset = os.path.getsize(data_file) - nbytes
+    if not os.path.exists(data_file) or os.path.getsize(data_file) < offset + nbytes:
         return None
 
+    shape = (count,) if channels == 1 else (count // channels, channels)
+    voxels = np.memmap(data_file, dtype=dtype, mode="c",
+                       offset=offset, shape=shape)
+    scalars = numpy_to_vtk(voxels, deep=0)
+    scalars.SetName(header.get("ElementDataName", "MetaImage"))
+
+    image = vtkImageData()
+    image.SetDimensions(dims)
+    image.SetSpacing(spacing)
+    image.SetOrigin(origin)
+    matrix = header.get("TransformMatrix", "").split()
+    if len(matrix) == 9:
+        # The axes are listed one after the other, i.e. the columns of the direction
+        image.SetDirectionMatrix(*np.reshape([float(x) for x in matrix], (3, 3)).T.ravel())
+    image.GetPointData().SetScalars(scalars)
+    return image
+
+
+META_IMAGE_TYPE_NAMES = {np.dtype(dtype): name
+                         for name, dtype in reversed(list(META_IMAGE_ELEMENT_TYPES.items()))}
 
-def load_surface(filename: str) -> vtkPolyData:
-    if filename.endswith('vtp'):
-        reader = vtkXMLPolyDataReader()
+
+def save_meta_image_raw(image: vtkImageData, filename: str):
+    """
+    Write an uncompressed MetaImage(.mha) keeping the direction as
+    TransformMatrix and the scalar name as ElementDataName, which
+    vtkMetaImageWriter drops, for load_meta_image_mmap to map it back.
+    """
+    scalars = image.GetPointData().GetScalars()
+    voxels = vtk_to_numpy(scalars)
+    type_name = META_IMAGE_TYPE_NAMES.get(voxels.dtype)
+    if type_name is None:
+        raise ValueError(f"Unsupported MetaImage element type:{voxels.dtype}")
+    extent = image.GetExtent()
+    origin = [0.0, 0.0, 0.0]
+    image.TransformIndexToPhysicalPoint(extent[0], extent[2], extent[4], origin)
+    direction = image.GetDirectionMatrix()
+    lines = [
+        "ObjectType = Image",
+        "NDims = 3",
+        "BinaryData = True",
+        f"BinaryDataByteOrderMSB = {sys.byteorder == 'big'}",
+        "CompressedData = False",
+        "TransformMatrix = " + " ".join(
+            repr(direction.GetElement(i, j)) for j in range(3) for i in range(3)),
+        "Offset = " + " ".join(repr(x) for x in origin),
+        "ElementSpacing = " + " ".join(repr(x) for x in image.GetSpacing()),
+        "DimSize = " + " ".join(str(x) for x in image.GetDimensions()),
+        f"ElementNumberOfChannels = {scalars.GetNumberOfComponents()}",
+        f"ElementType = {type_name}",
+    ]
+    if scalars.GetName():
+        lines.append(f"ElementDataName = {scalars.GetName()}")
+    lines.append("ElementDataFile = LOCAL")
+    with open(filename, "wb") as f:
+        f.write(("\n".join(lines) + "\n").encode("latin-1"))
+        np.ascontiguousarray(voxels).tofile(f)
+
+
+def read_meta_image_info(filename: str) -> dict:
+    return _image_info(*_meta_image_geometry(read_meta_image_header(filename)))
+
+
+def _image_info(dimensions, spacing, origin):
+    bounds = []
+    for i in range(3):
+        bounds += [origin[i], origin[i] + (dimensions[i] - 1) * spacing[i]]
+    return {
+        "dimensions": list(dimensions[:3]),
+        "spacing": list(spacing[:3]),
+        "origin": list(origin[:3]),
+        "bounds": bounds,
+    }
+
+
+def _vtk_reader(reader_class):
+    def read(filename):
+        reader = reader_class()
         reader.SetFileName(filename)
         reader.Update()
         return reader.GetOutput()
-    elif filename.endswith('stl'):
-        reader = vtkSTLReader()
+    return read
+
+
+def _vtk_image_info_reader(reader_class):
+    """
+    Header-only read through the pipeline information pass, no voxel is decoded.
+    """
+    def read_info(filename):
+        reader = reader_class()
         reader.SetFileName(filename)
-        reader.Update()
-        return reader.GetOutput()
-    else:
-        return None
+        reader.UpdateInformation()
+        info = reader.GetOutputInformation(0)
+        extent = info.Get(vtkStreamingDemandDrivenPipeline.WHOLE_EXTENT())
+        dims = [extent[1] - extent[0] + 1,
+                extent[3] - extent[2] + 1,
+                extent[5] - extent[4] + 1]
+        spacing = info.Get(vtkDataObject.SPACING()) or [1.0, 1.0, 1.0]
+        origin = info.Get(vtkDataObject.ORIGIN()) or [0.0, 0.0, 0.0]
+        origin = [origin[i] + extent[2 * i] * spacing[i] for i in range(3)]
+        return _image_info(dims, spacing, origin)
+    return read_info
 
 
-def save_image(image: vtkImageData, filename: str):
-    if filename.endswith('nii') or filename.endswith('nii.gz'):
-        writer = vtkNIFTIImageWriter()
-        writer.SetInputData(image)
-        writer.SetFileName(filename)
-        writer.Update()
-    if filename.endswith('vti'):
-        writer = vtkXMLImageDataWriter()
-        writer.SetInputData(image)
-        writer.SetFileName(filename)
-        writer.Update()
-    if filename.endswith('mha'):
-        writer = vtkMetaImageWriter()
-        writer.SetInputData(image)
+COMPRESSION_TYPES = ("none", "zlib", "lz4")
+
+
+def _vtk_writer(writer_class):
+    """
+    compression is one of COMPRESSION_TYPES, XML formats then write their
+    arrays as raw appended data compressed by it, meta images only
+    distinguish "none" from compressed.
+    """
+    def write(data, filename, compression=None, **kwargs):
+        writer = writer_class()
+        if compression is not None:
+            if compression not in COMPRESSION_TYPES:
+                raise ValueError(f"Unsupported compression type:{compression}")
+            if isinstance(writer, vtkXMLWriter):
+                writer.SetDataModeToAppended()
+                writer.EncodeAppendedDataOff()
+                if compression == "zlib":
+                    writer.SetCompressorTypeToZLib()
+                elif compression == "lz4":
+                    writer.SetCompressorTypeToLZ4()
+                else:
+                    writer.SetCompressorTypeToNone()
+            elif isinstance(writer, vtkMetaImageWriter):
+                writer.SetCompression(compression != "none")
+        writer.SetInputData(data)
         writer.SetFileName(filename)
-        writer.Update()
-    else:
+        writer.Write()
+        if writer.GetErrorCode():
+            raise IOError(f"Failed to write {filename}")
+    return write
+
+
+def _is_binary_stl(head: bytes, filename: str):
+    if len(head) < 84:
+        return False
+    count = int(np.frombuffer(head[80:84], dtype="<u4")[0])
+    return os.path.getsize(filename) == 84 + 50 * count
+
+
+class FileFormat:
+    """
+    Entry of the format registry.
+    reader(filename) returns the vtk data object or None to decline the file.
+    magic is a list of (offset, bytes) or a callable(head, filename) -> bool.
+    capabilities is a subset of {"streaming", "mmap", "header"}, "header"
+    requires info_reader(filename) returning dimensions/spacing/origin/bounds.
+    """
+
+    def __init__(self, name, data_type, extensions, reader=None, writer=None,
+                 magic=None, capabilities=(), priority=0, info_reader=None):
+        self.name = name
+        self.data_type = data_type
+        self.extensions = [x.lower().lstrip(".") for x in extensions]
+        self.reader = reader
+        self.writer = writer
+        self.magic = magic
+        self.capabilities = set(capabilities)
+        self.priority = priority
+        self.info_reader = info_reader
+
+    def match_extension(self, filename: str):
+        filename = filename.lower()
+        return any(filename.endswith("." + x) for x in self.extensions)
+
+    def match_magic(self, head: bytes, filename: str):
+        if not self.magic or not head:
+            return False
+        if callable(self.magic):
+            return self.magic(head, filename)
+        for offset, value in self.magic:
+            if head[offset:offset + len(value)] == value:
+                return True
+        return False
+
+
+class FormatRegistry:
+    """
+    Readers and writers registered by extension and magic bytes.
+    Third party formats are discovered through the "mipf.formats" entry point
+    group, each entry point refers to a FileFormat, a list of them, or a
+    callable taking the registry.
+    """
+    ENTRY_POINT_GROUP = "mipf.formats"
+    HEAD_SIZE = 512
+
+    def __init__(self):
+        self.formats = []
+        self._entry_points_loaded = False
+
+    def register(self, file_format: FileFormat):
+        self.formats.append(file_format)
+
+    def unregister(self, name: str):
+        self.formats = [x for x in self.formats if x.name != name]
+
+    def load_entry_points(self):
+        self._entry_points_loaded = True
+        from importlib.metadata import entry_points
+        eps = entry_points()
+        if hasattr(eps, "select"):
+            eps = eps.select(group=FormatRegistry.ENTRY_POINT_GROUP)
+        else:
+            eps = eps.get(FormatRegistry.ENTRY_POINT_GROUP, [])
+        for ep in eps:
+            try:
+                obj = ep.load()
+            except Exception as e:
+                print(f"Failed to load format plugin {ep.name}: {e}")
+                continue
+            if isinstance(obj, FileFormat):
+                self.register(obj)
+            elif isinstance(obj, (list, tuple)):
+                for file_format in obj:
+                    self.register(file_format)
+            elif callable(obj):
+                obj(self)
+
+    def _get_formats(self):
+        if not self._entry_points_loaded:
+            self.load_entry_points()
+        return self.formats
+
+    @staticmethod
+    def read_head(filename: str) -> bytes:
+        try:
+            with open(filename, "rb") as f:
+                head = f.read(FormatRegistry.HEAD_SIZE)
+        except OSError:
+            return b""
+        if head[:2] == b"\x1f\x8b":
+            try:
+                head = zlib.decompressobj(31).decompress(
+                    head, FormatRegistry.HEAD_SIZE)
+            except zlib.error:
+                pass
+        return head
+
+    def find_readers(self, filename: str, data_type=None, capabilities=()):
+        """
+        Readers able to open the file, best first.
+        Formats whose magic bytes match come before extension only matches,
+        then the ones having the requested capabilities, then by priority.
+        Memory mapping readers are only returned when "mmap" is requested.
+        """
+        head = self.read_head(filename)
+        candidates = []
+        for file_format in self._get_formats():
+            if not file_format.reader:
+                continue
+            if data_type and file_format.data_type != data_type:
+                continue
+            if "mmap" in file_format.capabilities and "mmap" not in capabilities:
+                continue
+            by_magic = file_format.match_magic(head, filename)
+            if not by_magic and not file_format.match_extension(filename):
+                continue
+            score = (by_magic,
+                     file_format.capabilities.issuperset(capabilities),
+                     file_format.priority)
+            candidates.append((score, file_format))
+        candidates.sort(key=lambda x: x[0], reverse=True)
+        return [x[1] for x in candidates]
+
+    def find_writer(self, filename: str, data_type=None):
+        writers = [x for x in self._get_formats()
+                   if x.writer and x.match_extension(filename) and
+                   (not data_type or x.data_type == data_type)]
+        if len(writers) == 0:
+            return None
+        return max(writers, key=lambda x: x.priority)
+
+    def get_data_type(self, filename: str):
+        readers = self.find_readers(filename)
+        return readers[0].data_type if readers else None
+
+    def read(self, filename: str, data_type=None, capabilities=()):
+        """
+        Read with the first reader accepting the file, return (data, format).
+        """
+        for file_format in self.find_readers(filename, data_type, capabilities):
+            data = file_format.reader(filename)
+            if data is not None:
+                return data, file_format
+        return None, None
+
+    def read_info(self, filename: str, data_type=None):
+        for file_format in self.find_readers(filename, data_type, ("header",)):
+            if file_format.info_reader:
+                return file_format.info_reader(filename)
+        return None
+
+
+format_registry = FormatRegistry()
+
+
+def register_format(file_format: FileFormat):
+    format_registry.register(file_format)
+
+
+register_format(FileFormat(
+    "nifti", "image", ["nii", "nii.gz"],
+    reader=_vtk_reader(vtkNIFTIImageReader),
+    writer=_vtk_writer(vtkNIFTIImageWriter),
+    magic=[(344, b"n+1\0"), (4, b"n+2\0")],
+    capabilities=["streaming", "header"],
+    info_reader=_vtk_image_info_reader(vtkNIFTIImageReader)))
+register_format(FileFormat(
+    "vti", "image", ["vti"],
+    reader=_vtk_reader(vtkXMLImageDataReader),
+    writer=_vtk_writer(vtkXMLImageDataWriter),
+    magic=lambda head, filename: b"<VTKFile" in head and b'type="ImageData"' in head,
+    capabilities=["streaming", "header"],
+    info_reader=_vtk_image_info_reader(vtkXMLImageDataReader)))
+register_format(FileFormat(
+    "meta_image", "image", ["mha", "mhd"],
+    reader=_vtk_reader(vtkMetaImageReader),
+    writer=_vtk_writer(vtkMetaImageWriter),
+    magic=[(0, b"ObjectType"), (0, b"NDims")],
+    capabilities=["header"],
+    info_reader=read_meta_image_info))
+register_format(FileFormat(
+    "meta_image_mmap", "image", ["mha", "mhd"],
+    reader=load_meta_image_mmap,
+    magic=[(0, b"ObjectType"), (0, b"NDims")],
+    capabilities=["mmap", "header"],
+    priority=10,
+    info_reader=read_meta_image_info))
+register_format(FileFormat(
+    "nrrd", "image", ["nrrd", "nhdr"],
+    reader=_vtk_reader(vtkNrrdReader),
+    magic=[(0, b"NRRD000")],
+    capabilities=["header"],
+    info_reader=_vtk_image_info_reader(vtkNrrdReader)))
+register_format(FileFormat(
+    "vtp", "surface", ["vtp"],
+    reader=_vtk_reader(vtkXMLPolyDataReader),
+    writer=_vtk_writer(vtkXMLPolyDataWriter),
+    magic=lambda head, filename: b"<VTKFile" in head and b'type="PolyData"' in head,
+    capabilities=["streaming"]))
+register_format(FileFormat(
+    "stl", "surface", ["stl"],
+    reader=_vtk_reader(vtkSTLReader),
+    writer=_vtk_writer(vtkSTLWriter),
+    magic=lambda head, filename: head[:5] == b"solid" or _is_binary_stl(head, filename)))
+register_format(FileFormat(
+    "ply", "surface", ["ply"],
+    reader=_vtk_reader(vtkPLYReader),
+    writer=_vtk_writer(vtkPLYWriter),
+    magic=[(0, b"ply")]))
+
+
+def read_image_file(filename: str, use_mmap: bool = False, use_cache: bool = True):
+    """
+    Read an image through the data cache and the format registry.
+    Return (image, memory_mapped), cache hits are always memory mapped.
+    """
+    if use_cache and data_cache.enabled():
+        image = data_cache.get_image(filename)
+        if image is not None:
+            return image, True
+    capabilities = ("mmap",) if use_mmap else ()
+    image, file_format = format_registry.read(filename, "image", capabilities)
+    if image is None:
+        return None, False
+    memory_mapped = "mmap" in file_format.capabilities
+    if use_cache and data_cache.enabled() and not memory_mapped:
+        data_cache.put_image(filename, image)
+    return image, memory_mapped
+
+
+def load_image(filename: str, use_mmap: bool = False, use_cache: bool = True) -> vtkImageData:
+    image, _ = read_image_file(filename, use_mmap, use_cache)
+    return image
+
+
+def read_image_info(filename: str) -> dict:
+    """
+    Read dimensions, spacing, origin and bounds from the header only.
+    """
+    return format_registry.read_info(filename, "image")
+
+
+def load_surface(filename: str, use_cache: bool = True) -> vtkPolyData:
+    if use_cache and data_cache.enabled():
+        polydata = data_cache.get_surface(filename)
+        if polydata is not None:
+            return polydata
+    polydata, file_format = format_registry.read(filename, "surface")
+    if use_cache and data_cache.enabled() and polydata is not None and \
+            file_format.name != "vtp":
+        data_cache.put_surface(filename, polydata)
+    return polydata
+
+
+def save_image(image: vtkImageData, filename: str, **kwargs):
+    file_format = format_registry.find_writer(filename, "image")
+    if not file_format:
         raise ValueError(f"Unsupported image file type:{filename}")
+    file_format.writer(image, filename, **kwargs)
 
 
-def save_surface(polydata: vtkPolyData, filename: str) -> vtkPolyData:
-    if filename.endswith('vtp'):
-        writer = vtkXMLPolyDataWriter()
-        writer.SetFileName(filename)
-        writer.Update()
-        return writer.GetOutput()
-    elif filename.endswith('stl'):
-        writer = vtkSTLWriter()
-        writer.SetFileName(filename)
-        writer.Update()
-        return writer.GetOutput()
-    else:
+def save_surface(polydata: vtkPolyData, filename: str, **kwargs):
+    file_format = format_registry.find_writer(filename, "surface")
+    if not file_format:
         raise ValueError(f"Unsupported Surface file type:{filename}")
+    file_format.writer(polydata, filename, **kwargs)
+
+
+def downsample_image(image: vtkImageData, factor: int = 2) -> vtkImageData:
+    """
+    Downsample by averaging blocks of factor^3 voxels, axes thinner than factor
+    are kept. The voxels past the last whole block are dropped.
+    """
+    dims = image.GetDimensions()
+    scalars = image.GetPointData().GetScalars()
+    channels = scalars.GetNumberOfComponents()
+    voxels = vtk_to_numpy(scalars).reshape(dims[2], dims[1], dims[0], channels)
+    factors = [factor if dims[i] >= factor else 1 for i in range(3)]
+    out_dims = [dims[i] // factors[i] for i in range(3)]
+    blocks = voxels[:out_dims[2] * factors[2],
+                    :out_dims[1] * factors[1],
+                    :out_dims[0] * factors[0]].reshape(
+        out_dims[2], factors[2], out_dims[1], factors[1], out_dims[0], factors[0], channels)
+    averaged = blocks.mean(axis=(1, 3, 5), dtype=np.float32)
+    if np.issubdtype(voxels.dtype, np.integer):
+        averaged = np.rint(averaged)
+    averaged = averaged.astype(voxels.dtype)
+
+    spacing = image.GetSpacing()
+    extent = image.GetExtent()
+    direction = image.GetDirectionMatrix()
+    # The output extent starts at 0, its voxels sit at the center of their blocks
+    offset = [(extent[2 * i] + (factors[i] - 1) * 0.5) * spacing[i] for i in range(3)]
+    origin = [image.GetOrigin()[i] + sum(direction.GetElement(i, j) * offset[j] for j in range(3))
+              for i in range(3)]
+    output = vtkImageData()
+    output.SetDimensions(out_dims)
+    output.SetSpacing([spacing[i] * factors[i] for i in range(3)])
+    output.SetOrigin(origin)
+    output.SetDirectionMatrix(direction)
+    array = numpy_to_vtk(averaged.reshape(-1, channels) if channels > 1 else averaged.ravel(),
+                         deep=0)
+    array.SetName(scalars.GetName())
+    output.GetPointData().SetScalars(array)
+    return output
+
+
+def spool_to_file(content, suffix: str = "", directory: str = None) -> str:
+    """
+    Write bytes or a list of byte chunks to a temporary file one chunk at a time,
+    the chunks are never joined into one more copy of the whole content.
+    The caller owns the returned file and should remove it.
+    """
+    if isinstance(content, (bytes, bytearray, memoryview)):
+        content = [content]
+    fd, filename = tempfile.mkstemp(suffix=suffix, dir=directory)
+    with os.fdopen(fd, "wb") as f:
+        for chunk in content:
+            f.write(chunk)
+    return filename
 
 
 def hex_to_float(hex_color):
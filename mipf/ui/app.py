@@ -4,13 +4,16 @@ from mipf.core.utils import *
 from mipf.core.settings import *
 from mipf.ui.data import *
 from mipf.ui.engine import *
+from mipf.core.io_manager import io_manager
 from abc import ABC, abstractmethod
+import os
 
 class AppBase(ABC):
     def __init__(self, server, app_name="Undefined"):
         self.server = server
         self.app_name = app_name
         self.data_storage = DataStorage()
+        render_window_manager.view_update = lambda: self.ctrl.view_update()
     
     @abstractmethod
     def setupui(self):
@@ -24,22 +27,71 @@ class AppBase(ABC):
     def ctrl(self):
         return self.server.controller
     
-    def load(self, filename: str, name="undefined"):
-        if filename.endswith('nii') or filename.endswith('nii.gz') or \
-                filename.endswith('vti') or filename.endswith('mha') or \
-                filename.endswith('nrrd'):
-            node = import_image_file(filename, name)
-            self.data_storage.add_node(node)
-            render_window_manager.request_update_all()
-            if self.server.protocol:
-                self.ctrl.reset_camera()
-                self.ctrl.view_update()
-        elif filename.endswith('vtp') or filename.endswith('stl'):
-            node = import_surface_file(filename, name)
-            self.data_storage.add_node(node)
-            render_window_manager.request_update_all()
-            if self.server.protocol:
-                self.ctrl.reset_camera()
-                self.ctrl.view_update()
+    def _import_file(self, filename: str, name="undefined", lazy=False):
+        if os.path.isdir(filename):
+            return import_dicom_series(filename, name)
+        data_type = format_registry.get_data_type(filename)
+        if data_type == "image":
+            return [import_image_file(filename, name, lazy=lazy)]
+        elif data_type == "surface":
+            return [import_surface_file(filename, name, lazy=lazy)]
         else:
-            print("Not a supported file ",filename)
\ No newline at end of file
+            print("Not a supported file ", filename)
+            return []
+
+    def _add_loaded_nodes(self, nodes):
+        with self.data_storage.batch():
+            for node in nodes:
+                self.data_storage.add_node(node)
+        render_window_manager.request_update_all()
+        if self.server.protocol:
+            self.ctrl.reset_camera()
+            self.ctrl.view_update()
+
+    def load(self, filename: str, name="undefined", lazy=False):
+        """
+        Load an image or surface file, or every DICOM series of a directory.
+        With lazy, only the headers are read now and the data on first use.
+        """
+        nodes = self._import_file(filename, name, lazy)
+        if nodes:
+            self._add_loaded_nodes(nodes)
+
+    async def load_async(self, filenames, names=None, lazy=False):
+        """
+        Decode the files in parallel on the io_manager pool, the nodes are added
+        to the data storage in one batch once all the files are decoded.
+        """
+        if isinstance(filenames, str):
+            filenames = [filenames]
+        if names is None:
+            names = [os.path.basename(filename) for filename in filenames]
+
+        with self.state:
+            self.state.loading = True
+            self.state.loading_progress = 0
+        results = await io_manager.map_async(
+            lambda index: self._import_file(filenames[index], names[index], lazy),
+            range(len(filenames)),
+            progress_callback=loading_progress_callback(self.state))
+        nodes = [node for nodes in results if nodes for node in nodes]
+        with self.state:
+            if nodes:
+                self._add_loaded_nodes(nodes)
+            self.state.loading = False
+        return nodes
+
+    async def export_async(self, directory, node_ids=None, compression="zlib"):
+        """
+        Export the nodes of the data storage to the directory in the background,
+        the progress is published in the "export_progress" state.
+        """
+        with self.state:
+            self.state.exporting = True
+            self.state.export_progress = 0
+        filenames = await self.data_storage.export_async(
+            directory, node_ids, compression,
+            progress_callback=loading_progress_callback(self.state, "export_progress"))
+        with self.state:
+            self.state.exporting = False
+        return filenames
@@ -26,7 +26,9 @@ class SliceNavigatorSlider:
         return self.ui
     
     def _update(self):
-        node = self.render_window.data_storage.get_top_node(DataType.Image)
+        data_storage = self.render_window.data_storage
+        node = data_storage.get_top_node(DataType.Image) or \
+            data_storage.get_top_node(DataType.TimeSeries)
         if node:
             image = node.get_data().get_image()
             dimensions = image.GetDimensions()
@@ -2,7 +2,7 @@ from trame.widgets import vuetify, html, trame
 
 from collections import defaultdict
 
-from mipf.core.data import DataStorage, DataNode, DataType
+from mipf.core.data import DataStorage, DataNode, DataType, IMAGE_DATA_TYPES
 from mipf.core.mapper import Representation
 from mipf.core.render_window_manager import render_window_manager
 from mipf.ui.common import *
@@ -20,6 +20,8 @@ class DataNodesTree:
                                             DataStorage.DataStorageEvent.REMOVE_NODE)
         self.data_storage.register_callback(self.pipeline.modified_node,
                                             DataStorage.DataStorageEvent.MODIFIED_NODE)
+        self.data_storage.register_callback(self.pipeline.batch_changed,
+                                            DataStorage.DataStorageEvent.BATCH)
         self.state = state
         self.ctrl = ctrl
         self.ui = self._setup_ui()
@@ -37,9 +39,9 @@ class DataNodesTree:
             self.pipeline.remove_node(_id)
 
     def _visiblity_changed(self, event):
-        for node in self.data_storage.nodes.values():
-            if node.get("id") == event.get("id"):
-                node["visible"] = event.get("visible")
+        node = self.data_storage.get_node(event.get("id"))
+        if node:
+            node["visible"] = event.get("visible")
         render_window_manager.request_update_all()
         self.ctrl.view_update()
 
@@ -52,9 +54,14 @@ class DataNodesTree:
                     self.state.surface_color = float_to_hex(node["color"])
                     if node.get("representation"):
                         self.state.current_representation = node["representation"]
-                elif node.data.type == DataType.Image:
+                elif node.data.type in IMAGE_DATA_TYPES:
                     self.state.active_node_type = "image"
-                    min, max = node.data.get_image().GetScalarRange()
+                    if node.data.type == DataType.LabelMap:
+                        # Without decoding the volume
+                        labels = node.data.get_label_values()
+                        min, max = 0, labels[-1] if labels else 0
+                    else:
+                        min, max = node.data.get_image().GetScalarRange()
                     self.state.update({
                         "image_min": min,
                         "image_max": max
@@ -1,3 +1,4 @@
+from trame.app import asynchronous
 from trame.app.file_upload import ClientFile
 from tkinter import filedialog
 from mipf.core.data import *
@@ -7,6 +8,10 @@ from mipf.core.pipeline_manager import PipelineManager
 from mipf.core.render_window import ViewType
 from mipf.core.mapper import *
 from mipf.core.engine import *
+from mipf.core.io_manager import io_manager
+from mipf.core.settings import general_settings
+import os
+import pathlib
 
 VIEW_INTERACT = [
     {"button": 1, "action": "Rotate"},
@@ -21,40 +26,135 @@ VIEW_INTERACT = [
 VIEW_SELECT = [{"button": 1, "action": "Select"}]
 
 
-def load_client_files(files, data_storage, **kwargs):
+def read_client_file(file, release_content=True):
+    """
+    Decode one uploaded file into a DataNode, None if the type is not supported.
+    The upload is received whole in the trame state, this does not stream it:
+    its chunks are written to a temporary file and parsed from there, so the
+    readers make no second in-memory copy. With release_content the payload is
+    dropped from the file dict once spooled, the caller should also clear the
+    "files" state so that the upload is freed.
+    """
+    name = file.get("name")
+    content = file.get("content")
+    if release_content:
+        file["content"] = None
+    print(f"Loading {name} ...")
+    suffix = "".join(pathlib.PurePath(name).suffixes[-2:])
+    filename = spool_to_file(content, suffix, general_settings.spool_directory)
+    del content
+    try:
+        data_type = format_registry.get_data_type(filename)
+        if data_type == "surface":
+            data = SurfaceData()
+            data.read_data(filename, use_cache=False)
+        elif data_type == "image":
+            data = ImageData()
+            data.read_data(filename, use_cache=False)
+        else:
+            print("Not a supported file ", name)
+            return None
+    finally:
+        os.remove(filename)
+    node = DataNode()
+    node["color"] = [1.0, 1.0, 1.0]
+    node["name"] = name
+    node.set_data(data)
+    return node
+
+
+def _has_content(files):
     if files is None or len(files) == 0:
+        return False
+    return bool(files[0].get("content"))
+
+
+def load_client_files(files, data_storage, **item_keys):
+    """
+    Read the uploaded files and add them to the data storage in one batch,
+    item_keys are set on every node.
+    """
+    if not _has_content(files):
         return []
-    if files and len(files):
-        if not files[0].get("content"):
-            return []   
 
     nodes = []
-    for file in files:
-        file = ClientFile(file)
-        print(f"Loading {file.name} ...")
-        if ".vtp" in file.name:
-            bytes = file.content
-            surface_data = SurfaceData()
-            surface_data.read_byte("vtp", bytes)
-            surface_node = DataNode()
-            surface_node["color"] = [1.0, 1.0, 1.0]
-            surface_node["name"] = file.name
-            surface_node.set_data(surface_data)
-            data_storage.add_node(surface_node)
-            nodes.append(surface_node)
-        elif ".vti" in file.name:
-            bytes = file.content
-            image_data = ImageData()
-            image_data.read_byte("vti", bytes)
-            image_node = DataNode()
-            image_node["color"] = [1.0, 1.0, 1.0]
-            image_node["name"] = file.name
-            image_node.set_data(image_data)
-            data_storage.add_node(image_node)
-            nodes.append(image_node)
+    with data_storage.batch():
+        for file in files:
+            node = read_client_file(file)
+            if node:
+                data_storage.add_node(node, **item_keys)
+                nodes.append(node)
+    render_window_manager.request_update_all()
+    return nodes
+
+
+async def load_client_files_async(files, data_storage, progress_callback=None, **item_keys):
+    """
+    Same as load_client_files but the files are decoded in parallel on the
+    io_manager pool, the nodes are added in one batch once all are decoded.
+    """
+    if not _has_content(files):
+        return []
+
+    nodes = await io_manager.map_async(read_client_file, files,
+                                       progress_callback=progress_callback)
+    nodes = [node for node in nodes if node]
+    with data_storage.batch():
+        for node in nodes:
+            data_storage.add_node(node, **item_keys)
     render_window_manager.request_update_all()
     return nodes
 
+
+def read_client_time_series(files, name=None, release_content=True):
+    """
+    Decode the uploaded image files, one per frame in this order, into one
+    time series DataNode.
+    """
+    filenames = []
+    try:
+        for file in files:
+            content = file.get("content")
+            if release_content:
+                file["content"] = None
+            suffix = "".join(pathlib.PurePath(file.get("name")).suffixes[-2:])
+            filenames.append(spool_to_file(content, suffix, general_settings.spool_directory))
+            del content
+        data = TimeSeriesImageData()
+        data.read_data(filenames, use_cache=False)
+    finally:
+        for filename in filenames:
+            os.remove(filename)
+    node = DataNode()
+    node["name"] = name or files[0].get("name")
+    node["time_step"] = 0
+    node.set_data(data)
+    return node
+
+
+async def load_client_time_series_async(files, data_storage, name=None, **item_keys):
+    """
+    Same as read_client_time_series on the io_manager pool, the node is
+    added to the data storage.
+    """
+    if not _has_content(files):
+        return None
+    node = await io_manager.run_async(read_client_time_series, files, name)
+    data_storage.add_node(node, **item_keys)
+    render_window_manager.request_update_all()
+    return node
+
+
+def loading_progress_callback(state, key="loading_progress"):
+    """
+    Progress callback feeding the key state, "loading_progress" by default, in percent.
+    """
+    def update_loading_progress(done, total):
+        with state:
+            state[key] = 100 * done / total if total else 100
+    return update_loading_progress
+
+
 def initialize_binding(server, data_storage, **kwargs):
     state, ctrl = server.state, server.controller
     plotter = kwargs.get("plotter")
@@ -65,8 +165,20 @@ def initialize_binding(server, data_storage, **kwargs):
     def input_files_changed(files, **kwargs):
         if files is None or len(files) == 0:
             return
-        load_client_files(files, data_storage, **kwargs)
-        ctrl.reset_camera()
+        asynchronous.create_task(load_files(files))
+
+    async def load_files(files):
+        with state:
+            # Only this task holds the upload from now on, freed file by file once spooled
+            state.files = None
+            state.loading = True
+            state.loading_progress = 0
+        await load_client_files_async(files, data_storage,
+                                      loading_progress_callback(state))
+        with state:
+            state.loading = False
+            ctrl.reset_camera()
+            ctrl.view_update()
 
     @ctrl.set("load_data")
     def load_data():
@@ -159,6 +271,7 @@ def initialize_binding(server, data_storage, **kwargs):
                             pointset_data.set_point(0, wp)
                         else:
                             pointset_data.add_point(wp)
+                        data_storage.invalidate_bounds(node.get("id"))
                         if node.get("activate"):
                             state.points_info = pointset_data.to_list()
             render_window_manager.request_update_all()
@@ -174,6 +287,7 @@ def initialize_binding(server, data_storage, **kwargs):
                         pointset_data.set_point(0, wp)
                     else:
                         pointset_data.add_point(wp)
+                    data_storage.invalidate_bounds(node.get("id"))
                     if node.get("activate"):
                         state.points_info = pointset_data.to_list()
             render_window_manager.request_update_all()
@@ -57,6 +57,9 @@ setup(
         },
     zip_safe=False,
     install_requires=install_requires,
+    extras_require={
+        'dicom': ['pydicom'],
+    },
     python_requires="==3.8.*",
     entry_points={
           'console_scripts': [
@@ -0,0 +1,38 @@
+import numpy as np
+import pytest
+from vtkmodules.vtkCommonDataModel import vtkImageData
+from vtkmodules.util.numpy_support import numpy_to_vtk, vtk_to_numpy
+
+from mipf.core.data_cache import data_cache
+from mipf.core.utils import read_image_file, save_image
+
+
+@pytest.fixture
+def cache_directory(tmp_path):
+    data_cache.set_directory(str(tmp_path / "cache"))
+    yield tmp_path
+    data_cache.set_directory(None)
+
+
+def test_cached_image_keeps_direction_and_scalars(cache_directory):
+    voxels = np.arange(4 * 5 * 6, dtype=np.int16)
+    image = vtkImageData()
+    image.SetDimensions(4, 5, 6)
+    image.SetSpacing(0.5, 1.5, 3)
+    image.SetOrigin(1, 2, 3)
+    image.SetDirectionMatrix(0, 1, 0, -1, 0, 0, 0, 0, 1)
+    scalars = numpy_to_vtk(voxels, deep=1)
+    scalars.SetName("density")
+    image.GetPointData().SetScalars(scalars)
+    filename = str(cache_directory / "oriented.vti")
+    save_image(image, filename, compression="none")
+
+    first, first_mapped = read_image_file(filename)
+    second, second_mapped = read_image_file(filename)
+    assert not first_mapped and second_mapped
+    for output in (first, second):
+        assert output.GetBounds() == pytest.approx(image.GetBounds())
+        assert [output.GetDirectionMatrix().GetElement(i, j) for i in range(3) for j in range(3)] == \
+            [image.GetDirectionMatrix().GetElement(i, j) for i in range(3) for j in range(3)]
+        assert output.GetPointData().GetScalars().GetName() == "density"
+        np.testing.assert_array_equal(vtk_to_numpy(output.GetPointData().GetScalars()), voxels)
@@ -0,0 +1,57 @@
+import numpy as np
+import pytest
+from vtkmodules.vtkCommonDataModel import vtkImageData
+from vtkmodules.vtkCommonMath import vtkMatrix4x4
+from vtkmodules.vtkImagingCore import vtkImageReslice
+from vtkmodules.util.numpy_support import numpy_to_vtk, vtk_to_numpy
+
+from mipf.core.mapper import ResliceMatrix
+from mipf.core.slice_cache import extract_aligned_slice
+
+VIEW_MATRICES = {
+    "axial": (ResliceMatrix.Axial_Matrix, 2),
+    "sagittal": (ResliceMatrix.Sagittal_Matrix, 0),
+    "coronal": (ResliceMatrix.Coronal_Matrix, 1),
+}
+
+
+def _make_image(voxels):
+    image = vtkImageData()
+    image.SetDimensions(voxels.shape[::-1])
+    image.SetSpacing(0.7, 1.1, 1.3)
+    image.SetOrigin(-2, 3, 1.5)
+    image.GetPointData().SetScalars(numpy_to_vtk(voxels.ravel(), deep=1))
+    return image
+
+
+def _reslice(image, matrix, interpolation):
+    axes = vtkMatrix4x4()
+    axes.DeepCopy(matrix)
+    reslice = vtkImageReslice()
+    reslice.SetInputData(image)
+    reslice.SetOutputDimensionality(2)
+    reslice.SetResliceAxes(axes)
+    reslice.SetInterpolationMode(interpolation)
+    reslice.Update()
+    return reslice.GetOutput()
+
+
+@pytest.mark.parametrize("view", list(VIEW_MATRICES))
+@pytest.mark.parametrize("dtype", [np.uint8, np.int16, np.int32])
+@pytest.mark.parametrize("interpolation", [0, 1])
+def test_extract_aligned_slice_matches_reslice(view, dtype, interpolation):
+    rng = np.random.default_rng(0)
+    matrix, normal = VIEW_MATRICES[view]
+    for _ in range(40):
+        image = _make_image(rng.integers(0, 250, (9, 8, 7)).astype(dtype))
+        bounds = image.GetBounds()
+        axes = list(matrix)
+        axes[4 * normal + 3] = rng.uniform(bounds[2 * normal] - 1, bounds[2 * normal + 1] + 1)
+
+        expected = _reslice(image, axes, interpolation)
+        output = extract_aligned_slice(image, axes, interpolation)
+        assert output.GetDimensions() == expected.GetDimensions()
+        assert output.GetOrigin() == pytest.approx(expected.GetOrigin())
+        np.testing.assert_array_equal(
+            vtk_to_numpy(output.GetPointData().GetScalars()).ravel(),
+            vtk_to_numpy(expected.GetPointData().GetScalars()).ravel())
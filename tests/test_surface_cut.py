@@ -0,0 +1,58 @@
+import numpy as np
+from vtkmodules.vtkCommonDataModel import vtkPlane
+from vtkmodules.vtkFiltersCore import vtkCutter
+from vtkmodules.vtkFiltersSources import vtkSphereSource
+from vtkmodules.util.numpy_support import numpy_to_vtk, vtk_to_numpy
+
+from mipf.core.surface_cut import SurfaceCutIndex
+
+
+def _colored_sphere():
+    sphere = vtkSphereSource()
+    sphere.SetThetaResolution(24)
+    sphere.SetPhiResolution(18)
+    sphere.Update()
+    polydata = sphere.GetOutput()
+    colors = numpy_to_vtk(np.arange(polydata.GetNumberOfCells(), dtype=np.int32), deep=1)
+    colors.SetName("colors")
+    polydata.GetCellData().SetScalars(colors)
+    return polydata
+
+
+def _sorted_lines(contour):
+    """
+    Lines of the contour as sorted pairs of (point, cell scalar) rows, in
+    a canonical order.
+    """
+    points = vtk_to_numpy(contour.GetPoints().GetData())
+    lines = vtk_to_numpy(contour.GetLines().GetConnectivityArray()).reshape(-1, 2)
+    colors = vtk_to_numpy(contour.GetCellData().GetScalars())
+    rows = [tuple(sorted(map(tuple, np.round(points[line], 6)))) + (int(color),)
+            for line, color in zip(lines, colors)]
+    return sorted(rows)
+
+
+def test_cut_matches_cutter_with_cell_scalars():
+    polydata = _colored_sphere()
+    index = SurfaceCutIndex(polydata)
+    for position in (-0.31, 0.0, 0.17, 0.42):
+        origin, normal = (0, 0, position), (0, 0, 1)
+        plane = vtkPlane()
+        plane.SetOrigin(origin)
+        plane.SetNormal(normal)
+        cutter = vtkCutter()
+        cutter.SetCutFunction(plane)
+        cutter.SetInputData(polydata)
+        cutter.Update()
+
+        contour = index.cut(origin, normal)
+        assert contour.GetCellData().GetScalars().GetName() == "colors"
+        assert _sorted_lines(contour) == _sorted_lines(cutter.GetOutput())
+
+
+def test_memory_size_counts_cached_contours():
+    index = SurfaceCutIndex(_colored_sphere())
+    index.cut((0, 0, 0.1), (0, 0, 1))
+    axis = index._get_axis(2)
+    arrays = sum(array.nbytes for array in axis[:5])
+    assert index.get_memory_size() > arrays
@@ -0,0 +1,37 @@
+import numpy as np
+from vtkmodules.vtkFiltersSources import vtkSphereSource
+
+from mipf.core.data import SurfaceData
+
+
+def _sphere_data():
+    sphere = vtkSphereSource()
+    sphere.SetThetaResolution(8)
+    sphere.SetPhiResolution(7)
+    sphere.Update()
+    data = SurfaceData()
+    data._polydata = sphere.GetOutput()
+    return data
+
+
+def test_from_array_with_faces_drops_stale_attributes():
+    data = _sphere_data()
+    polydata = data.get_polydata()
+    assert polydata.GetPointData().GetArray("Normals") is not None
+
+    data.from_array([[0, 0, 0], [1, 0, 0], [0, 1, 0]], faces=[[0, 1, 2]])
+    polydata = data.get_polydata()
+    assert polydata.GetNumberOfPoints() == 3
+    assert polydata.GetNumberOfCells() == 1
+    assert polydata.GetPointData().GetNumberOfArrays() == 0
+    assert polydata.GetCellData().GetNumberOfArrays() == 0
+    assert data.as_array().shape == (3, 3)
+
+
+def test_from_array_with_faces_keeps_point_data_of_same_points():
+    data = _sphere_data()
+    points = data.as_array().copy()
+    faces = [[0, 1, 2], [2, 3, 4]]
+    data.from_array(points, faces=faces)
+    assert data.as_array("Normals").shape == (len(points), 3)
+    assert data.get_polydata().GetNumberOfCells() == 2